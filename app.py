@@ -1,23 +1,38 @@
 # Файл: app.py
 import logging
 import os
-import re
 import datetime
 import html
-from collections import deque
+import hmac
+import time
 import functools # Для functools.wraps
+from collections import deque
 
-from flask import Flask, request, jsonify, Response, make_response
+from flask import Flask, request, jsonify, Response, make_response, g
 from flask_cors import CORS
 import jwt
 import base64
 
+from chat_channels import DEFAULT_CHANNEL_ID, ChannelRegistry, parse_ingest_keys
+from chat_journal import ChatJournal, JournaledChatStore, channel_journal_dir
+from chat_store import create_chat_store
+from chat_stream import parse_last_event_id
+from dedup import dedup_key
+from jwt_cache import VerifiedTokenCache
+from log_parser import ChatRecord, KillEvent, RoundEvent, TeamSwitchEvent, iter_log_events, parse_log_batch
+from log_stream import CorruptedBody, LogLineReader, PayloadTooLarge, UnsupportedContentEncoding
+from metrics import MetricsRegistry
+from stream_tickets import StreamTicketIssuer
+from udp_receiver import UdpLogReceiver, parse_udp_sources
+
 # --- Flask App Setup ---
 app = Flask(__name__)
 
 # --- Logging Configuration ---
 logging.getLogger('werkzeug').setLevel(logging.WARNING)
-logging.basicConfig(level=logging.DEBUG,
+# LOG_LEVEL (DEBUG, INFO, WARNING, ...) - уровень логирования, по умолчанию INFO.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL,
                     format='%(asctime)s %(name)s %(levelname)s %(module)s %(funcName)s L%(lineno)d: %(message)s')
 logger = logging.getLogger(__name__)
 
@@ -34,6 +49,14 @@ else:
     except Exception as e:
         logger.critical(f"Ошибка декодирования TWITCH_EXTENSION_SECRET из Base64: {e}", exc_info=True)
 
+# Кэш проверенных JWT: клиент расширения присылает один и тот же токен до истечения его exp.
+JWT_CACHE_SIZE = int(os.environ.get('JWT_CACHE_SIZE', 10000))
+verified_token_cache = VerifiedTokenCache(maxsize=JWT_CACHE_SIZE)
+
+# Билеты для /chat/stream (см. /chat/stream/ticket): живут STREAM_TICKET_TTL_SECONDS и погашаются один раз.
+STREAM_TICKET_TTL_SECONDS = int(os.environ.get('STREAM_TICKET_TTL_SECONDS', 30))
+stream_tickets = StreamTicketIssuer(EXTENSION_SECRET, ttl=STREAM_TICKET_TTL_SECONDS) if EXTENSION_SECRET else None
+
 # --- CORS Configuration for Production ---
 TWITCH_EXTENSION_ID_ENV = os.environ.get('TWITCH_EXTENSION_ID')
 
@@ -60,39 +83,152 @@ CORS(app, resources={
         "supports_credentials": True,
         "max_age": 86400
     },
+    r"/chat/stream/ticket": {
+        "origins": chat_origins_config,
+        "methods": ["POST", "OPTIONS"],
+        "allow_headers": ["Authorization", "Content-Type"],
+        "supports_credentials": True,
+        "max_age": 86400
+    },
+    r"/chat/stream": {
+        "origins": chat_origins_config,
+        "methods": ["GET", "OPTIONS"],
+        "allow_headers": ["Authorization", "Content-Type", "Last-Event-ID"],
+        "supports_credentials": True,
+        "max_age": 86400
+    },
+    r"/chat/history": {
+        "origins": chat_origins_config,
+        "methods": ["GET", "OPTIONS"],
+        "allow_headers": ["Authorization", "Content-Type"],
+        "supports_credentials": True,
+        "max_age": 86400
+    },
+    r"/events": {
+        "origins": chat_origins_config,
+        "methods": ["GET", "OPTIONS"],
+        "allow_headers": ["Authorization", "Content-Type"],
+        "supports_credentials": True,
+        "max_age": 86400
+    },
     r"/gsi": {
         "origins": gsi_origins_config, # Разрешаем POST с любого источника для логов
         "methods": ["POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type", "Content-Encoding", "X-Ingest-Key", "X-Batch-Id"]
     },
     r"/submit_logs": { # Алиас
         "origins": gsi_origins_config,
         "methods": ["POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type", "Content-Encoding", "X-Ingest-Key", "X-Batch-Id"]
     }
 }, supports_credentials=True)
 
 
 # --- Data Storage ---
 MAX_CHAT_MESSAGES_DISPLAY = 100
-display_chat_messages = deque(maxlen=MAX_CHAT_MESSAGES_DISPLAY)
-
-# --- Regex Definition for Chat ---
-CHAT_REGEX_SAY = re.compile(
-    r"""
-    ^\s* # Начало строки, опциональные пробелы.
-    (?:\d{2}\/\d{2}\/\d{4}\s+-\s+)?      # Опциональная дата (ДД/ММ/ГГГГ - ).
-    (?P<timestamp>\d{2}:\d{2}:\d{2}\.\d{3})  # Временная метка (ЧЧ:ММ:СС.мс)
-    \s+-\s+                                  # Разделитель " - ".
-    \"(?P<player_name>.+?)<(?P<userid>\d+)><(?P<steamid>\[U:\d:\d+\])><(?P<player_team>\w+)>\"
-    \s+                                      # Пробел.
-    (?P<chat_command>say|say_team)           # Команда чата ('say' или 'say_team')
-    \s+                                      # Пробел.
-    \"(?P<message>.*)\"                      # Содержимое сообщения в кавычках
-    \s*$                                     # Опциональные пробелы, конец строки.
-    """,
-    re.VERBOSE | re.IGNORECASE
-)
+# CHAT_STORE_BACKEND=memory - буфер в памяти процесса (один воркер gunicorn).
+# CHAT_STORE_BACKEND=sqlite - общий буфер в SQLite (WAL) по пути CHAT_STORE_PATH для нескольких воркеров.
+CHAT_STORE_BACKEND = os.environ.get('CHAT_STORE_BACKEND', 'memory').lower()
+CHAT_STORE_PATH = os.environ.get('CHAT_STORE_PATH', 'chat_store.sqlite3')
+# CHAT_JOURNAL_DIR - каталог журнала сообщений на диске (только для CHAT_STORE_BACKEND=memory).
+# С журналом буфер переживает перезапуск, а /chat/history отдает сообщения старше буфера.
+CHAT_JOURNAL_DIR = os.environ.get('CHAT_JOURNAL_DIR', '')
+CHAT_JOURNAL_SEGMENT_BYTES = int(os.environ.get('CHAT_JOURNAL_SEGMENT_BYTES', 8 * 1024 * 1024))
+CHAT_JOURNAL_MAX_SEGMENTS = int(os.environ.get('CHAT_JOURNAL_MAX_SEGMENTS', 64))
+# fsync журнала выполняется каждые CHAT_JOURNAL_FSYNC_EVERY записей или раз в CHAT_JOURNAL_FSYNC_SECONDS.
+CHAT_JOURNAL_FSYNC_EVERY = int(os.environ.get('CHAT_JOURNAL_FSYNC_EVERY', 64))
+CHAT_JOURNAL_FSYNC_SECONDS = float(os.environ.get('CHAT_JOURNAL_FSYNC_SECONDS', 1.0))
+if CHAT_JOURNAL_DIR and CHAT_STORE_BACKEND != 'memory':
+    logger.warning("CHAT_JOURNAL_DIR игнорируется: журнал поддерживается только с CHAT_STORE_BACKEND=memory.")
+    CHAT_JOURNAL_DIR = ''
+# Интервал heartbeat для подписчиков /chat/stream.
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+
+# --- Каналы ---
+# GSI_INGEST_KEYS="ключ1:channel_id1,ключ2:channel_id2" - ключ сервера для /gsi определяет канал Twitch,
+# а /chat берет канал из channel_id в проверенном JWT. Без GSI_INGEST_KEYS работает один общий канал.
+GSI_INGEST_KEYS = parse_ingest_keys(os.environ.get('GSI_INGEST_KEYS'))
+# UDP_LOG_SOURCES="ip[:port][=channel_id],..." - серверы, чьи логи принимаются по UDP (см. UDP_LOG_PORT).
+UDP_LOG_SOURCES = parse_udp_sources(os.environ.get('UDP_LOG_SOURCES'), DEFAULT_CHANNEL_ID)
+INGEST_CHANNEL_IDS = frozenset(GSI_INGEST_KEYS.values()) | frozenset(UDP_LOG_SOURCES.values())
+MULTI_CHANNEL = bool(INGEST_CHANNEL_IDS - {DEFAULT_CHANNEL_ID})
+MAX_CHAT_CHANNELS = int(os.environ.get('MAX_CHAT_CHANNELS', 500))
+
+
+def _create_channel_store(channel_id):
+    store = create_chat_store(CHAT_STORE_BACKEND, MAX_CHAT_MESSAGES_DISPLAY, CHAT_STORE_PATH, channel_id,
+                              dedup_max_keys=GSI_DEDUP_MAX_KEYS, dedup_window=GSI_DEDUP_WINDOW_SECONDS)
+    if not CHAT_JOURNAL_DIR:
+        return store
+    journal = ChatJournal(
+        channel_journal_dir(CHAT_JOURNAL_DIR, channel_id),
+        segment_bytes=CHAT_JOURNAL_SEGMENT_BYTES, max_segments=CHAT_JOURNAL_MAX_SEGMENTS,
+        fsync_every=CHAT_JOURNAL_FSYNC_EVERY, fsync_interval=CHAT_JOURNAL_FSYNC_SECONDS
+    )
+    store = JournaledChatStore(store, journal)
+    logger.info("Канал %s: из журнала восстановлено %s сообщений за %.1f мс.",
+                channel_id, len(store), store.recovery_seconds * 1000)
+    return store
+
+
+# У каждого канала свой буфер, кэш готового JSON для /chat и рассылка для /chat/stream.
+# GSI_DEDUP_WINDOW_SECONDS / GSI_DEDUP_MAX_KEYS - окно и размер памяти дедупликации повторных загрузок.
+GSI_DEDUP_WINDOW_SECONDS = float(os.environ.get('GSI_DEDUP_WINDOW_SECONDS', 600))
+GSI_DEDUP_MAX_KEYS = int(os.environ.get('GSI_DEDUP_MAX_KEYS', 20000))
+# MAX_GAME_EVENTS - сколько последних игровых событий (убийства, раунды, смена команды) хранить для /events.
+# По умолчанию 0: события выключены и логи разбираются быстрым путем только на сообщения чата
+# (разбор событий примерно в 10 раз медленнее, см. bench/bench_events.py).
+MAX_GAME_EVENTS = int(os.environ.get('MAX_GAME_EVENTS', 0))
+chat_channels = ChannelRegistry(_create_channel_store, max_channels=MAX_CHAT_CHANNELS,
+                                heartbeat_interval=SSE_HEARTBEAT_SECONDS,
+                                dedup_max_keys=GSI_DEDUP_MAX_KEYS, dedup_window=GSI_DEDUP_WINDOW_SECONDS,
+                                max_game_events=MAX_GAME_EVENTS)
+if MULTI_CHANNEL:
+    logger.info(f"Хранилище чата: {CHAT_STORE_BACKEND}. Подключенных каналов: {len(INGEST_CHANNEL_IDS)}.")
+else:
+    logger.info(f"Хранилище чата: {CHAT_STORE_BACKEND}. Используется один общий канал.")
+
+
+# --- Metrics ---
+# Метрики процесса для /metrics (формат Prometheus). При нескольких воркерах gunicorn у каждого свои значения.
+metrics = MetricsRegistry()
+METRIC_LOG_LINES = metrics.counter('cs2chat_log_lines_total', 'Прочитано строк лога', ['source'])
+METRIC_CHAT_LINES = metrics.counter('cs2chat_chat_lines_total', 'Найдено строк чата (say/say_team)', ['source'])
+METRIC_MESSAGES_ADDED = metrics.counter('cs2chat_chat_messages_added_total', 'Добавлено сообщений в буферы чата')
+METRIC_GAME_EVENTS = metrics.counter('cs2chat_game_events_total', 'Принято игровых событий', ['type'])
+METRIC_DUPLICATE_LINES = metrics.counter('cs2chat_chat_duplicate_lines_total', 'Пропущено повторно присланных строк чата')
+METRIC_INGEST_SECONDS = metrics.histogram('cs2chat_gsi_ingest_seconds', 'Время обработки запроса /gsi')
+METRIC_CHAT_REQUESTS = metrics.counter('cs2chat_chat_requests_total', 'Запросы к /chat, /chat/history, /chat/stream и /events', ['endpoint', 'status'])
+METRIC_AUTH_FAILURES = metrics.counter('cs2chat_auth_failures_total', 'Отклоненные запросы к защищенным эндпоинтам', ['reason'])
+metrics.callback('cs2chat_auth_cache_hits_total', 'Попадания в кэш проверенных JWT',
+                 lambda: verified_token_cache.hits, type_name='counter')
+metrics.callback('cs2chat_auth_cache_misses_total', 'Промахи кэша проверенных JWT',
+                 lambda: verified_token_cache.misses, type_name='counter')
+metrics.callback('cs2chat_auth_cache_entries', 'Записей в кэше проверенных JWT', lambda: len(verified_token_cache))
+metrics.callback('cs2chat_channels', 'Каналов в реестре', lambda: len(chat_channels))
+metrics.callback('cs2chat_chat_buffer_messages', 'Сообщений в буфере чата канала',
+                 lambda: [((channel.channel_id,), len(channel.store)) for channel in chat_channels.channels()],
+                 labelnames=['channel'])
+metrics.callback('cs2chat_sse_subscribers', 'Подключений /chat/stream',
+                 lambda: sum(channel.broadcaster.subscriber_count for channel in chat_channels.channels()))
+# METRICS_TOKEN - если задан, /metrics требует заголовок "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+
+def resolve_ingest_channel_id():
+    """Канал для /gsi по ключу сервера (заголовок X-Ingest-Key или ?key=). None - ключ неверный."""
+    if not GSI_INGEST_KEYS:
+        return DEFAULT_CHANNEL_ID
+    ingest_key = request.headers.get('X-Ingest-Key') or request.args.get('key')
+    return GSI_INGEST_KEYS.get(ingest_key)
+
+
+def resolve_viewer_channel_id():
+    """Канал для /chat по channel_id из проверенного JWT. None - канал не подключен."""
+    if not MULTI_CHANNEL:
+        return DEFAULT_CHANNEL_ID
+    channel_id = str(g.jwt_payload.get('channel_id') or '')
+    return channel_id if channel_id in INGEST_CHANNEL_IDS else None
 
 # --- HTML for root URL with Test Button ---
 MINIMAL_CHAT_HTML_WITH_CSS = """<!DOCTYPE html><html lang="ru">
@@ -199,153 +335,436 @@ MINIMAL_CHAT_HTML_WITH_CSS = """<!DOCTYPE html><html lang="ru">
 </body></html>"""
 
 # --- Декоратор для проверки JWT ---
-def token_required(f):
+# allow_query_ticket=True разрешает вместо заголовка передать ?ticket=<билет> из /chat/stream/ticket:
+# EventSource в браузере не умеет отправлять заголовок Authorization. Сам JWT в URL не принимается,
+# так как URL записываются в логи роутера платформы (например, Heroku).
+def token_required(f=None, *, allow_query_ticket=False):
+    if f is None:
+        return functools.partial(token_required, allow_query_ticket=allow_query_ticket)
+
     @functools.wraps(f)
     def decorated(*args, **kwargs):
-        logger.info(f"Запрос к защищенному эндпоинту: {request.path}")
-        logger.debug(f"Все входящие заголовки: {list(request.headers.items())}")
+        logger.debug("Запрос к защищенному эндпоинту: %s", request.path)
+        logger.debug("Все входящие заголовки: %s", request.headers)
 
         if not EXTENSION_SECRET:
             logger.critical("EXTENSION_SECRET не настроен на сервере в момент запроса. Аутентификация невозможна.")
+            METRIC_AUTH_FAILURES.inc(reason='no_secret')
             return jsonify({"error": "Критическая ошибка сервера: секрет расширения не настроен"}), 500
 
         token = None
         auth_header_value = request.headers.get('Authorization')
 
         if auth_header_value:
-            logger.info(f"Найден заголовок Authorization: '{auth_header_value}'")
             parts = auth_header_value.split(" ")
             if len(parts) == 2 and parts[0].lower() == "bearer":
                 token = parts[1]
                 if not token:
                     logger.warning("Пустой токен в заголовке Authorization после 'Bearer '.")
+                    METRIC_AUTH_FAILURES.inc(reason='malformed')
                     return jsonify({"error": "Пустой токен в заголовке Authorization"}), 401
-                logger.info(f"Извлечен токен (первые 15 символов): {token[:15]}...")
+                logger.debug("Извлечен токен (первые 15 символов): %s...", token[:15])
             else:
-                logger.warning(f"Некорректный формат заголовка Authorization: '{auth_header_value}'. Ожидался 'Bearer <token>'.")
+                logger.warning("Некорректный формат заголовка Authorization: '%s...'. Ожидался 'Bearer <token>'.", auth_header_value[:20])
+                METRIC_AUTH_FAILURES.inc(reason='malformed')
                 return jsonify({"error": "Некорректный формат заголовка Authorization"}), 401
+        elif allow_query_ticket and request.args.get('ticket'):
+            claims = stream_tickets.redeem(request.args.get('ticket'))
+            if claims is None:
+                logger.warning("Неверный, просроченный или уже использованный билет в запросе к %s.", request.path)
+                METRIC_AUTH_FAILURES.inc(reason='invalid_ticket')
+                return jsonify({"error": "Неверный или уже использованный билет"}), 401
+            g.jwt_payload = claims
+            return f(*args, **kwargs)
         else:
             logger.warning("Заголовок 'Authorization' отсутствует в запросе.")
+            METRIC_AUTH_FAILURES.inc(reason='missing')
             return jsonify({"error": "Заголовок Authorization отсутствует"}), 401
 
         try:
-            payload = jwt.decode(token, EXTENSION_SECRET, algorithms=["HS256"])
-            logger.info(f"JWT валиден. Payload: {payload}")
+            payload = verified_token_cache.get(token)
+            if payload is None:
+                payload = jwt.decode(token, EXTENSION_SECRET, algorithms=["HS256"])
+                verified_token_cache.put(token, payload)
+                logger.debug("JWT валиден и добавлен в кэш. Payload: %s", payload)
+            g.jwt_payload = payload
         except jwt.ExpiredSignatureError:
             logger.warning("Получен просроченный JWT (ExpiredSignatureError).")
+            METRIC_AUTH_FAILURES.inc(reason='expired')
             return jsonify({"error": "Срок действия токена истек"}), 401
         except jwt.InvalidTokenError as e:
-            logger.warning(f"Получен невалидный JWT: {e}", exc_info=True) # Добавил exc_info для деталей
+            logger.warning("Получен невалидный JWT: %s", e, exc_info=True) # Добавил exc_info для деталей
+            METRIC_AUTH_FAILURES.inc(reason='invalid')
             return jsonify({"error": "Невалидный токен авторизации"}), 401
         except Exception as e:
-            logger.error(f"Непредвиденная ошибка при декодировании или проверке JWT: {e}", exc_info=True)
+            logger.error("Непредвиденная ошибка при декодировании или проверке JWT: %s", e, exc_info=True)
+            METRIC_AUTH_FAILURES.inc(reason='error')
             return jsonify({"error": "Ошибка при обработке токена авторизации"}), 500
 
         return f(*args, **kwargs)
     return decorated
 
-# --- GSI / Log Data Handler (для текстовых логов CS2) ---
-@app.route('/gsi', methods=['POST'])
-@app.route('/submit_logs', methods=['POST']) # Алиас
-def gsi_data_handler():
-    global display_chat_messages
-    log_lines = []
-    
-    content_type = request.headers.get('Content-Type', '').lower()
-    logger.info(f"Запрос к /gsi. Content-Type: '{content_type}'")
+# Записывает разобранные строки чата в канал. Вся пачка применяется под блокировкой
+# канала, поэтому очистка !team1 и новые сообщения одной пачки не перемешиваются с другими.
+# Строки, уже принятые в окне дедупликации (повторная отправка ретранслятором), пропускаются.
+# Возвращает (добавлено сообщений, пропущено повторов).
+def apply_chat_records(channel, chat_records):
+    store = channel.store
+    # Уровень проверяется один раз на пачку, а не на каждую строку.
+    log_each_line = logger.isEnabledFor(logging.DEBUG)
+    with channel.ingest_lock:
+        new_messages_added_count = 0
+        duplicate_count = 0
+        for record in chat_records:
+            # Ключ проверяется и запоминается хранилищем в одной операции с записью сообщения.
+            line_key = dedup_key(record.ts, record.steamid, record.message)
+            sender_name_raw = record.player_name
+            message_text_raw = record.message
 
-    try:
-        raw_data_text = request.get_data(as_text=True)
-        if raw_data_text:
-            log_lines = raw_data_text.splitlines()
-            logger.info(f"/gsi: Тело запроса успешно прочитано как текст, получено {len(log_lines)} строк.")
-            if len(log_lines) > 0:
-                 logger.debug(f"/gsi: Первая полученная строка: {log_lines[0][:200]}...")
-        else:
-            logger.warning("/gsi: Тело запроса пустое при чтении как текст.")
-            return jsonify({"status": "success", "message": "Получен пустой запрос."}), 200
-    except Exception as e:
-        logger.error(f"Ошибка при чтении тела запроса как текст в /gsi: {e}", exc_info=True)
-        return jsonify({"status": "error", "message": "Ошибка при чтении тела запроса"}), 400
-
-    if not log_lines: # Эта проверка может быть избыточной, если пустой запрос уже обработан выше
-        logger.info("/gsi: Нет строк для обработки после чтения тела запроса.")
-        return jsonify({"status": "success", "message": "Нет строк для обработки."}), 200
-
-    new_messages_added_count = 0
-    for i, line_content in enumerate(log_lines):
-        if not isinstance(line_content, str):
-            logger.warning(f"Элемент {i+1} в log_lines не является строкой, пропускается: {type(line_content)}")
-            continue
-        if not line_content.strip():
-            logger.debug(f"Строка {i+1} пустая, пропускается.")
-            continue
-            
-        logger.debug(f"Обработка строки {i+1}: {line_content[:100]}...")
-        chat_match = CHAT_REGEX_SAY.search(line_content)
-        if chat_match:
-            extracted_data = chat_match.groupdict()
-            chat_command_type = extracted_data['chat_command'].lower()
-            sender_name_raw = extracted_data['player_name'].strip()
-            message_text_raw = extracted_data['message'].strip()
-            
             if message_text_raw.lower().startswith("!team1"):
+                if not store.clear(line_key):
+                    duplicate_count += 1
+                    continue
                 command_param_part = message_text_raw[len("!team1"):].strip()
-                logger.info(f"Пользователь '{sender_name_raw}' выполнил команду !team1 (параметр: '{command_param_part}'). Очистка чата.")
-                display_chat_messages.clear()
+                logger.info("Пользователь '%s' выполнил команду !team1 (параметр: '%s'). Очистка чата.", sender_name_raw, command_param_part)
                 system_message = {
                     "ts": datetime.datetime.now(datetime.timezone.utc).strftime("%H:%M:%S.%f")[:-3],
                     "sender": "СИСТЕМА",
                     "msg": f"Чат очищен по команде от {html.escape(sender_name_raw)}. Инфо: {html.escape(command_param_part)}",
                     "team": "Other"
                 }
-                display_chat_messages.append(system_message)
+                store.append(system_message)
                 new_messages_added_count +=1
                 continue
 
-            if chat_command_type == "say":
-                timestamp_str = extracted_data.get('timestamp', datetime.datetime.now(datetime.timezone.utc).strftime("%H:%M:%S.%f")[:-3])
-                player_team_raw = extracted_data['player_team']
-                
-                if not message_text_raw:
-                    logger.debug(f"Пустое 'say' сообщение от {sender_name_raw}, пропускается.")
-                    continue
+            if record.command != "say" or not message_text_raw:
+                if not store.remember(line_key):
+                    duplicate_count += 1
+                elif log_each_line and record.command == "say":
+                    logger.debug("Пустое 'say' сообщение от %s, пропускается.", sender_name_raw)
+                continue
 
-                team_identifier = "Other"
-                if player_team_raw.upper() == "CT": team_identifier = "CT"
-                elif player_team_raw.upper() == "TERRORIST" or player_team_raw.upper() == "T": team_identifier = "T"
-                
-                message_obj_for_display = {
-                    "ts": timestamp_str,
-                    "sender": html.escape(sender_name_raw),
-                    "msg": html.escape(message_text_raw),
-                    "team": team_identifier
-                }
-                display_chat_messages.append(message_obj_for_display)
-                new_messages_added_count += 1
-                logger.debug(f"Добавлено сообщение от {sender_name_raw}: {message_text_raw[:50]}...")
+            team_identifier = "Other"
+            player_team_upper = record.team.upper()
+            if player_team_upper == "CT": team_identifier = "CT"
+            elif player_team_upper == "TERRORIST" or player_team_upper == "T": team_identifier = "T"
+
+            message_obj_for_display = {
+                "ts": record.ts,
+                "sender": html.escape(sender_name_raw),
+                "msg": html.escape(message_text_raw),
+                "team": team_identifier
+            }
+            if store.append(message_obj_for_display, line_key) is None:
+                duplicate_count += 1
+                continue
+            new_messages_added_count += 1
+            if log_each_line:
+                logger.debug("Добавлено сообщение от %s: %s...", sender_name_raw, message_text_raw[:50])
+
+    METRIC_DUPLICATE_LINES.inc(duplicate_count)
+    if new_messages_added_count > 0:
+        METRIC_MESSAGES_ADDED.inc(new_messages_added_count)
+        channel.snapshot_cache.invalidate()
+        channel.broadcaster.publish()
+    return new_messages_added_count, duplicate_count
+
+# Тип события в ответе /events.
+GAME_EVENT_TYPES = {KillEvent: "kill", RoundEvent: "round", TeamSwitchEvent: "team_switch"}
+
+
+def parse_ingest_lines(lines):
+    """Разбирает строки лога за один проход. Возвращает (строки чата, игровые события).
+
+    Из игровых событий сохраняются только последние MAX_GAME_EVENTS: более ранние все равно
+    вытеснятся из кольца канала, а память на разбор большого тела остается ограниченной.
+    """
+    if not MAX_GAME_EVENTS:
+        return parse_log_batch(lines), []
+    chat_records = []
+    game_events = deque(maxlen=MAX_GAME_EVENTS)
+    for event in iter_log_events(lines):
+        if type(event) is ChatRecord:
+            chat_records.append(event)
         else:
-            logger.debug(f"Строка не соответствует CHAT_REGEX_SAY: {line_content[:100]}...")
-    
+            game_events.append(event)
+    return chat_records, game_events
+
+# Добавляет игровые события в канал; повторно присланные (в окне дедупликации) пропускаются.
+def apply_game_events(channel, game_events):
+    added_count = 0
+    with channel.ingest_lock:
+        for event in game_events:
+            if not channel.seen_events.add(dedup_key(type(event).__name__, *event)):
+                continue
+            event_type = GAME_EVENT_TYPES[type(event)]
+            event_obj = {"type": event_type}
+            for field, value in zip(event._fields, event):
+                event_obj[field] = html.escape(value) if isinstance(value, str) else value
+            channel.game_events.append(event_obj)
+            METRIC_GAME_EVENTS.inc(type=event_type)
+            added_count += 1
+    return added_count
+
+# --- GSI / Log Data Handler (для текстовых логов CS2) ---
+# Лимиты на распакованное тело запроса и длину одной строки лога.
+GSI_MAX_BODY_BYTES = int(os.environ.get('GSI_MAX_BODY_BYTES', 64 * 1024 * 1024))
+GSI_MAX_LINE_LENGTH = int(os.environ.get('GSI_MAX_LINE_LENGTH', 8192))
+
+@app.route('/gsi', methods=['POST'])
+@app.route('/submit_logs', methods=['POST']) # Алиас
+def gsi_data_handler():
+    started = time.perf_counter()
+    content_type = request.headers.get('Content-Type', '').lower()
+    content_encoding = request.headers.get('Content-Encoding', '')
+    channel_id = resolve_ingest_channel_id()
+    logger.debug("Запрос к /gsi. Канал: %s. Content-Type: '%s', Content-Encoding: '%s'", channel_id, content_type, content_encoding)
+    if channel_id is None:
+        logger.warning("/gsi: Отсутствует или неверный ключ приема логов (X-Ingest-Key).")
+        return jsonify({"status": "error", "message": "Неверный ключ приема логов"}), 403
+
+    # X-Batch-Id (необязательный) - ID пачки от ретранслятора; повтор уже принятой пачки не обрабатывается.
+    channel = chat_channels.get(channel_id)
+    batch_id = request.headers.get('X-Batch-Id')
+    batch_key = dedup_key('batch', batch_id) if batch_id else None
+    if batch_key is not None and channel.store.seen(batch_key):
+        logger.info("/gsi: Пачка %s канала %s уже была принята, повтор пропущен.", batch_id, channel_id)
+        return jsonify({"status": "success", "message": f"Пачка {batch_id} уже была обработана.", "duplicate": True}), 200
+
+    # Тело читается из request.stream построчно: в памяти только текущий блок и найденные строки чата.
+    try:
+        line_reader = LogLineReader(
+            request.stream,
+            content_encoding=content_encoding,
+            max_body_bytes=GSI_MAX_BODY_BYTES,
+            max_line_length=GSI_MAX_LINE_LENGTH
+        )
+        chat_records, game_events = parse_ingest_lines(line_reader)
+    except UnsupportedContentEncoding:
+        logger.warning("/gsi: Неподдерживаемый Content-Encoding: '%s'.", content_encoding)
+        return jsonify({"status": "error", "message": "Неподдерживаемый Content-Encoding"}), 415
+    except PayloadTooLarge:
+        logger.warning("/gsi: Тело запроса больше лимита %s байт, запрос отклонен.", GSI_MAX_BODY_BYTES)
+        return jsonify({"status": "error", "message": "Тело запроса слишком большое"}), 413
+    except CorruptedBody as e:
+        logger.warning("/gsi: Сжатое тело запроса обрезано или повреждено (%s), запрос отклонен.", e)
+        return jsonify({"status": "error", "message": "Сжатое тело запроса повреждено"}), 400
+    except Exception as e:
+        logger.error("Ошибка при чтении тела запроса в /gsi: %s", e, exc_info=True)
+        return jsonify({"status": "error", "message": "Ошибка при чтении тела запроса"}), 400
+
+    METRIC_LOG_LINES.inc(line_reader.lines, source='http')
+    METRIC_CHAT_LINES.inc(len(chat_records), source='http')
+    if line_reader.skipped_lines:
+        logger.warning("/gsi: Пропущено %s строк длиннее %s символов.", line_reader.skipped_lines, GSI_MAX_LINE_LENGTH)
+    if not line_reader.lines:
+        logger.warning("/gsi: Тело запроса пустое.")
+        return jsonify({"status": "success", "message": "Получен пустой запрос."}), 200
+
+    logger.debug("/gsi: Прочитано %s строк (%s байт), найдено %s строк чата.", line_reader.lines, line_reader.bytes_read, len(chat_records))
+
+    new_messages_added_count, duplicate_count = apply_chat_records(channel, chat_records)
+    if game_events:
+        apply_game_events(channel, game_events)
+    if batch_key is not None:
+        channel.store.remember(batch_key)
+    if duplicate_count:
+        logger.info("Канал %s: пропущено %s повторно присланных строк чата.", channel_id, duplicate_count)
     if new_messages_added_count > 0:
-        logger.info(f"Добавлено {new_messages_added_count} новых сообщений для чата. Всего в очереди: {len(display_chat_messages)}.")
+        logger.info("Канал %s: прочитано %s строк, добавлено %s новых сообщений для чата.", channel_id, line_reader.lines, new_messages_added_count)
     else:
-        logger.info("Новых сообщений для чата не добавлено по результатам обработки этих логов.")
-            
-    return jsonify({"status": "success", "message": f"Обработано {len(log_lines)} строк, добавлено {new_messages_added_count} сообщений."}), 200
+        logger.debug("Новых сообщений для чата не добавлено по результатам обработки этих логов.")
+
+    METRIC_INGEST_SECONDS.observe(time.perf_counter() - started)
+    return jsonify({"status": "success", "message": f"Обработано {line_reader.lines} строк, добавлено {new_messages_added_count} сообщений, пропущено повторов: {duplicate_count}."}), 200
 
 # --- API Endpoint for Chat Data ---
+# Без параметров возвращает список всех сообщений.
+# С ?since=<id>[&epoch=<epoch>] возвращает только сообщения новее <id>:
+# {"epoch": ..., "head": ..., "reset": ..., "messages": [...]}.
+# reset=true означает, что клиент должен заменить свой список целиком (была очистка !team1).
 @app.route('/chat', methods=['GET'])
 @token_required
 def get_structured_chat_data():
-    logger.info(f"Запрос к /chat. Отправка {len(display_chat_messages)} сообщений.")
+    channel_id = resolve_viewer_channel_id()
+    if channel_id is None:
+        logger.info("Запрос к /chat для неподключенного канала %s.", g.jwt_payload.get('channel_id'))
+        return jsonify({"error": "Для этого канала не настроен прием логов"}), 404
+    channel = chat_channels.get(channel_id)
+    since_param = request.args.get('since')
+    epoch_param = request.args.get('epoch')
     try:
-        response_data = list(display_chat_messages)
-        return jsonify(response_data)
+        if since_param is not None:
+            try:
+                cursor = int(since_param)
+                client_epoch = int(epoch_param) if epoch_param is not None else None
+            except ValueError:
+                return jsonify({"error": "Параметры since и epoch должны быть целыми числами"}), 400
+            delta = channel.store.since(cursor, client_epoch)
+            logger.debug("Запрос к /chat?since=%s. Отправка %s сообщений (reset=%s).", cursor, len(delta.messages), delta.reset)
+            return jsonify({
+                "epoch": delta.epoch,
+                "head": delta.head,
+                "reset": delta.reset,
+                "messages": delta.messages
+            })
+
+        snapshot = channel.snapshot_cache.get()
+        use_gzip = bool(request.accept_encodings['gzip'])
+        etag = snapshot.etag_gzip if use_gzip else snapshot.etag
+        if request.if_none_match.contains(etag):
+            logger.debug("Запрос к /chat. ETag %s совпал, ответ 304.", etag)
+            response = Response(status=304)
+        else:
+            logger.debug("Запрос к /chat. Отправка %s сообщений.", snapshot.count)
+            if use_gzip:
+                response = Response(snapshot.body_gzip, mimetype='application/json')
+                response.headers['Content-Encoding'] = 'gzip'
+            else:
+                response = Response(snapshot.body, mimetype='application/json')
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
-        logger.error(f"Критическая ошибка в get_structured_chat_data при jsonify: {e}", exc_info=True)
+        logger.error("Критическая ошибка в get_structured_chat_data при jsonify: %s", e, exc_info=True)
         return jsonify({"error": "Ошибка сервера при формировании ответа чата"}), 500
 
+# --- API Endpoint for Chat History ---
+# ?before=<id>&limit=<n> - до n сообщений с ID меньше <id> из журнала (по умолчанию - самые новые).
+# Ответ: {"messages": [...], "next_before": <ID самого старого сообщения или null>}.
+# Следующая страница запрашивается с before=next_before; null - более старых сообщений нет.
+# Требуется CHAT_JOURNAL_DIR.
+CHAT_HISTORY_DEFAULT_LIMIT = 50
+CHAT_HISTORY_MAX_LIMIT = 200
+
+
+@app.route('/chat/history', methods=['GET'])
+@token_required
+def get_chat_history():
+    channel_id = resolve_viewer_channel_id()
+    if channel_id is None:
+        return jsonify({"error": "Для этого канала не настроен прием логов"}), 404
+    store = chat_channels.get(channel_id).store
+    if not hasattr(store, 'history'):
+        return jsonify({"error": "История чата не включена на сервере"}), 404
+    try:
+        before = int(request.args.get('before', store.version()[1] + 1))
+        limit = int(request.args.get('limit', CHAT_HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Параметры before и limit должны быть целыми числами"}), 400
+    limit = max(1, min(limit, CHAT_HISTORY_MAX_LIMIT))
+    messages = store.history(before, limit)
+    logger.debug("Запрос к /chat/history?before=%s&limit=%s. Отправка %s сообщений.", before, limit, len(messages))
+    return jsonify({
+        "messages": messages,
+        "next_before": messages[0]["id"] if len(messages) == limit else None
+    })
+
+# --- API Endpoint for Game Events ---
+# Последние MAX_GAME_EVENTS игровых событий канала, от старых к новым:
+# [{"type": "kill"|"round"|"team_switch", "ts": ..., ...поля события}].
+@app.route('/events', methods=['GET'])
+@token_required
+def get_game_events():
+    channel_id = resolve_viewer_channel_id()
+    if channel_id is None:
+        return jsonify({"error": "Для этого канала не настроен прием логов"}), 404
+    if not MAX_GAME_EVENTS:
+        return jsonify({"error": "Игровые события не включены на сервере"}), 404
+    return jsonify(list(chat_channels.get(channel_id).game_events))
+
+# --- Server-Sent Events Endpoint for Chat ---
+# Аутентификация выполняется один раз при подключении: заголовок Authorization
+# или ?ticket=<билет>, полученный POST /chat/stream/ticket с заголовком Authorization.
+# Билет одноразовый, поэтому при переподключении клиент запрашивает новый билет
+# и передает ?lastEventId=<id последнего события>, чтобы получить пропущенное.
+# Первое событие - reset с текущим буфером, далее приходят только новые сообщения (id: <epoch>:<id>).
+# Поля JWT, которые переносятся в билет.
+STREAM_TICKET_CLAIMS = ('channel_id', 'opaque_user_id', 'user_id', 'role')
+
+
+@app.route('/chat/stream/ticket', methods=['POST'])
+@token_required
+def issue_stream_ticket():
+    claims = {name: g.jwt_payload[name] for name in STREAM_TICKET_CLAIMS if name in g.jwt_payload}
+    return jsonify({"ticket": stream_tickets.issue(claims), "expires_in": stream_tickets.ttl})
+
+
+@app.route('/chat/stream', methods=['GET'])
+@token_required(allow_query_ticket=True)
+def chat_event_stream():
+    channel_id = resolve_viewer_channel_id()
+    if channel_id is None:
+        return jsonify({"error": "Для этого канала не настроен прием логов"}), 404
+    broadcaster = chat_channels.get(channel_id).broadcaster
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    epoch, cursor = parse_last_event_id(last_event_id)
+    logger.info("Подключение к /chat/stream канала %s (Last-Event-ID: %s). Подписчиков: %s.", channel_id, last_event_id, broadcaster.subscriber_count + 1)
+    response = Response(broadcaster.stream(epoch, cursor), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# --- UDP Log Receiver (logaddress_add) ---
+# UDP_LOG_PORT включает встроенный прием логов по UDP: на сервере CS2 достаточно
+# "logaddress_add <host>:<port>". Строки разбираются тем же parse_ingest_lines, что и в /gsi.
+UDP_LOG_PORT = os.environ.get('UDP_LOG_PORT')
+UDP_LOG_HOST = os.environ.get('UDP_LOG_HOST', '0.0.0.0')
+UDP_LOG_BATCH_SIZE = int(os.environ.get('UDP_LOG_BATCH_SIZE', 500))
+UDP_LOG_BATCH_INTERVAL = float(os.environ.get('UDP_LOG_BATCH_INTERVAL', 0.2))
+# UDP_LOG_SECRET - значение sv_logsecret на серверах CS2. Если задан, принимаются только пакеты
+# с этим секретом; без него пакеты с секретом отклоняются (задайте его, если sv_logsecret включен).
+UDP_LOG_SECRET = os.environ.get('UDP_LOG_SECRET') or None
+
+
+def ingest_log_lines(channel_id, lines):
+    chat_records, game_events = parse_ingest_lines(lines)
+    METRIC_LOG_LINES.inc(len(lines), source='udp')
+    METRIC_CHAT_LINES.inc(len(chat_records), source='udp')
+    if game_events:
+        apply_game_events(chat_channels.get(channel_id), game_events)
+    if not chat_records:
+        return 0
+    new_messages_added_count, duplicate_count = apply_chat_records(chat_channels.get(channel_id), chat_records)
+    logger.debug("UDP: канал %s, строк %s, добавлено %s сообщений, повторов %s.", channel_id, len(lines), new_messages_added_count, duplicate_count)
+    return new_messages_added_count
+
+
+udp_log_receiver = None
+if UDP_LOG_PORT:
+    if not UDP_LOG_SOURCES:
+        logger.error("UDP_LOG_PORT задан, но UDP_LOG_SOURCES пуст: прием логов по UDP не запущен.")
+    else:
+        udp_log_receiver = UdpLogReceiver(
+            UDP_LOG_HOST, int(UDP_LOG_PORT), UDP_LOG_SOURCES, ingest_log_lines,
+            batch_size=UDP_LOG_BATCH_SIZE, batch_interval=UDP_LOG_BATCH_INTERVAL,
+            log_secret=UDP_LOG_SECRET
+        )
+        udp_log_receiver.start()
+        metrics.callback('cs2chat_udp_packets_total', 'Принято UDP-пакетов с логами',
+                         lambda: udp_log_receiver.packets, type_name='counter')
+        metrics.callback('cs2chat_udp_dropped_packets_total', 'Отброшено UDP-пакетов от неразрешенных источников',
+                         lambda: udp_log_receiver.dropped_packets, type_name='counter')
+        metrics.callback('cs2chat_udp_rejected_packets_total', 'Отклонено UDP-пакетов: неверный тип или sv_logsecret',
+                         lambda: udp_log_receiver.rejected_packets, type_name='counter')
+
+# --- Metrics Endpoint ---
+@app.after_request
+def count_chat_requests(response):
+    if request.endpoint in ('get_structured_chat_data', 'get_chat_history', 'chat_event_stream', 'get_game_events'):
+        METRIC_CHAT_REQUESTS.inc(endpoint=request.endpoint, status=response.status_code)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if METRICS_TOKEN:
+        auth_header_value = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header_value.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            return jsonify({"error": "Доступ к /metrics запрещен"}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # --- Main HTML Page Route ---
 @app.route('/', methods=['GET'])
 def index():
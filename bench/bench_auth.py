@@ -0,0 +1,61 @@
+# Файл: bench/bench_auth.py
+# Стоимость аутентификации одного запроса в token_required: с кэшем проверенных JWT и без него.
+# Запуск: python bench/bench_auth.py [кол-во запросов]
+import base64
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SECRET = b"bench-extension-secret-0123456789abcdef"
+os.environ['TWITCH_EXTENSION_SECRET'] = base64.b64encode(SECRET).decode()
+
+import jwt  # noqa: E402
+
+import app as chat_app  # noqa: E402
+
+
+@chat_app.token_required
+def protected_view():
+    return "ok"
+
+
+def measure(requests_count, token, use_cache):
+    cache = chat_app.verified_token_cache
+    cache.clear()
+    headers = {'Authorization': f'Bearer {token}'}
+    with chat_app.app.test_request_context('/chat', headers=headers):
+        protected_view()  # прогрев
+        started = time.perf_counter()
+        for _ in range(requests_count):
+            if not use_cache:
+                cache.clear()
+            protected_view()
+        elapsed = time.perf_counter() - started
+    return elapsed / requests_count
+
+
+def main():
+    requests_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    logging.disable(logging.CRITICAL)
+    token = jwt.encode(
+        {'exp': int(time.time()) + 3600, 'opaque_user_id': 'U123', 'channel_id': '1', 'role': 'viewer'},
+        SECRET, algorithm='HS256'
+    )
+
+    uncached = measure(requests_count, token, use_cache=False)
+    cache = chat_app.verified_token_cache
+    hits_before, misses_before = cache.hits, cache.misses
+    cached = measure(requests_count, token, use_cache=True)
+
+    print(f"Запросов: {requests_count}")
+    print(f"Без кэша (jwt.decode): {uncached * 1e6:8.2f} мкс/запрос")
+    print(f"С кэшем:               {cached * 1e6:8.2f} мкс/запрос")
+    print(f"Ускорение: x{uncached / cached:.1f}")
+    print(f"Кэш: попаданий {cache.hits - hits_before}, промахов {cache.misses - misses_before}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Файл: bench/bench_events.py
+# Бенчмарк разбора игровых событий: отдельный проход регулярного выражения на каждый
+# тип события против однопроходного LogEventParser с диспетчеризацией по глаголу.
+# Стоимость строки у LogEventParser не должна расти с числом типов событий.
+# Запуск: python bench/bench_events.py [кол-во строк]
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from log_parser import CHAT_REGEX_SAY, LogEventParser, default_event_parser
+from synthlog import generate_lines
+
+# Типы событий в порядке подключения и их глаголы.
+EVENT_TYPES = [
+    ("chat", ("say", "say_team")),
+    ("kill", ("killed",)),
+    ("round", ("triggered",)),
+    ("team_switch", ("switched",)),
+]
+
+# Полные регулярные выражения на каждый тип - так выглядел бы разбор без общего префикса.
+_PREFIX = r'\s*(?:\d{2}/\d{2}/\d{4}\s+-\s+)?(?P<timestamp>\d{2}:\d{2}:\d{2}\.\d{3})\s+-\s+'
+_PLAYER = r'"(?P<{0}>.+?)<\d+><(?P<{0}_steamid>[^>]*)>(?:<(?P<{0}_team>[^>]*)>)?"'
+PER_TYPE_REGEXES = {
+    "chat": CHAT_REGEX_SAY,
+    "kill": re.compile(_PREFIX + _PLAYER.format('killer') + r'\s+\[[^\]]*\]\s+killed\s+'
+                       + _PLAYER.format('victim') + r'\s+\[[^\]]*\]\s+with\s+"(?P<weapon>[^"]*)"'),
+    "round": re.compile(_PREFIX + r'World\s+triggered\s+"(?P<event>Round_Start|Round_End)"'),
+    "team_switch": re.compile(_PREFIX + _PLAYER.format('player')
+                              + r'\s+switched\s+from\s+team\s+<(?P<from_team>[^>]*)>\s+to\s+<(?P<to_team>[^>]*)>'),
+}
+
+
+def build_dispatcher(type_count, extra_verbs=0):
+    """Парсер с первыми type_count типами событий и extra_verbs пустыми обработчиками."""
+    parser = LogEventParser()
+    handlers = default_event_parser.handlers
+    for _name, verbs in EVENT_TYPES[:type_count]:
+        for verb in verbs:
+            parser.register(verb)(handlers[verb])
+    for i in range(extra_verbs):
+        parser.register(f"extra_verb_{i}")(lambda prefix, args: None)
+    return parser.parse
+
+
+def build_multi_pass(type_count):
+    regexes = [PER_TYPE_REGEXES[name].match for name, _verbs in EVENT_TYPES[:type_count]]
+
+    def parse(lines):
+        events = []
+        for match in regexes:
+            for line in lines:
+                found = match(line)
+                if found is not None:
+                    events.append(found)
+        return events
+    return parse
+
+
+def measure(func, lines, repeat=5):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(lines)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    lines = generate_lines(count)
+    print(f"Строк: {count}. Время на строку, нс:")
+    print(f"{'типов событий':>14} {'проход на тип':>14} {'диспетчер':>10} {'диспетчер +64 глагола':>22} {'событий':>8}")
+    for type_count in range(1, len(EVENT_TYPES) + 1):
+        multi_s, multi_events = measure(build_multi_pass(type_count), lines)
+        dispatch_s, events = measure(build_dispatcher(type_count), lines)
+        wide_s, _events = measure(build_dispatcher(type_count, extra_verbs=64), lines)
+        if len(multi_events) != len(events):
+            raise SystemExit(f"Расхождение результатов: {len(multi_events)} != {len(events)}")
+        print(f"{type_count:>14} {multi_s / count * 1e9:>14.0f} {dispatch_s / count * 1e9:>10.0f} "
+              f"{wide_s / count * 1e9:>22.0f} {len(events):>8}")
+
+
+if __name__ == '__main__':
+    main()
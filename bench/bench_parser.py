@@ -0,0 +1,71 @@
+# Файл: bench/bench_parser.py
+# Микро-бенчмарк разбора логов: исходный CHAT_REGEX_SAY.search (с якорем ^) по каждой строке
+# (как было в gsi_data_handler) против parse_log_batch с быстрым отсевом.
+# Запуск: python bench/bench_parser.py [кол-во строк]
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from log_parser import parse_log_batch
+from synthlog import generate_lines
+
+# Копия регулярного выражения из app.py до выделения log_parser.py: с якорем ^ и IGNORECASE.
+BASELINE_CHAT_REGEX_SAY = re.compile(
+    r"""
+    ^\s*
+    (?:\d{2}\/\d{2}\/\d{4}\s+-\s+)?
+    (?P<timestamp>\d{2}:\d{2}:\d{2}\.\d{3})
+    \s+-\s+
+    \"(?P<player_name>.+?)<(?P<userid>\d+)><(?P<steamid>\[U:\d:\d+\])><(?P<player_team>\w+)>\"
+    \s+
+    (?P<chat_command>say|say_team)
+    \s+
+    \"(?P<message>.*)\"
+    \s*$
+    """,
+    re.VERBOSE | re.IGNORECASE
+)
+
+
+def baseline(lines):
+    matches = []
+    for line in lines:
+        if not line.strip():
+            continue
+        chat_match = BASELINE_CHAT_REGEX_SAY.search(line)
+        if chat_match:
+            matches.append(chat_match.groupdict())
+    return matches
+
+
+def measure(func, lines, repeat=5):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(lines)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    lines = generate_lines(count)
+
+    before_s, before = measure(baseline, lines)
+    after_s, after = measure(parse_log_batch, lines)
+    if len(before) != len(after):
+        raise SystemExit(f"Расхождение результатов: {len(before)} != {len(after)}")
+
+    print(f"Строк: {count}, строк чата: {len(after)}")
+    print(f"До    (search на каждой строке): {count / before_s:>12,.0f} строк/с")
+    print(f"После (parse_log_batch):         {count / after_s:>12,.0f} строк/с")
+    print(f"Ускорение: x{before_s / after_s:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Файл: bench/bench_udp.py
+# Пропускная способность приема логов на loopback: встроенный UDP-прием против POST /gsi.
+# Запуск: python bench/bench_udp.py [кол-во строк] [строк в HTTP-запросе]
+import http.client
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import app as chat_app  # noqa: E402
+from synthlog import generate_lines  # noqa: E402
+from udp_receiver import PACKET_PREFIX, UdpLogReceiver  # noqa: E402
+
+
+def bench_udp(lines):
+    receiver = UdpLogReceiver('127.0.0.1', 0, {('127.0.0.1', None): chat_app.DEFAULT_CHANNEL_ID},
+                              chat_app.ingest_log_lines)
+    port = receiver.bind()
+    receiver.start()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    packets = [PACKET_PREFIX + b'RL ' + line.encode('utf-8') + b'\n\x00' for line in lines]
+
+    started = time.perf_counter()
+    for packet in packets:
+        sender.sendto(packet, ('127.0.0.1', port))
+    # UDP может терять пакеты при переполнении буфера сокета, поэтому ждем не все строки,
+    # а момент, когда приемник перестал продвигаться.
+    finished, last_seen = time.perf_counter(), -1
+    while receiver.lines != last_seen:
+        last_seen, finished = receiver.lines, time.perf_counter()
+        time.sleep(0.2)
+    receiver.stop()  # stop() отправляет последнюю пачку в хранилище
+    sender.close()
+    return finished - started, receiver.lines
+
+
+def bench_http(lines, lines_per_request):
+    server = make_server('127.0.0.1', 0, chat_app.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_port)
+    requests_sent = 0
+
+    started = time.perf_counter()
+    for offset in range(0, len(lines), lines_per_request):
+        body = '\n'.join(lines[offset:offset + lines_per_request]).encode('utf-8')
+        conn.request('POST', '/gsi', body=body, headers={'Content-Type': 'text/plain'})
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            raise SystemExit(f"/gsi вернул {response.status}")
+        requests_sent += 1
+    elapsed = time.perf_counter() - started
+
+    conn.close()
+    server.shutdown()
+    return elapsed, requests_sent
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    lines_per_request = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    logging.disable(logging.CRITICAL)
+    lines = generate_lines(count)
+
+    udp_s, udp_lines = bench_udp(lines)
+    http_s, http_requests = bench_http(lines, lines_per_request)
+
+    print(f"Строк: {count}")
+    print(f"UDP (1 строка в пакете):           {udp_lines / udp_s:>10,.0f} строк/с, получено {udp_lines}/{count}")
+    print(f"HTTP /gsi ({lines_per_request} строк в запросе): {count / http_s:>10,.0f} строк/с, запросов {http_requests}")
+
+
+if __name__ == '__main__':
+    main()
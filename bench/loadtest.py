@@ -0,0 +1,429 @@
+# Файл: bench/loadtest.py
+# Нагрузочный тест /gsi и /chat: воспроизведение лога в /gsi с заданной скоростью (строк/с)
+# и параллельный опрос /chat "зрителями" с подписанными HS256 JWT расширения.
+# Результат - JSON с задержками p50/p99, пропускной способностью и RSS сервера.
+#
+# Запуск:
+#   python bench/loadtest.py                      # приложение в этом процессе (werkzeug, потоки)
+#   python bench/loadtest.py --gunicorn           # gunicorn на localhost с локальным тестовым секретом
+#   python bench/loadtest.py --url http://127.0.0.1:8080 --secret <base64 секрет расширения>
+# Пример: python bench/loadtest.py --gunicorn --worker-class gevent --rate 5000 --pollers 200 --output load.json
+#
+# В режиме "в процессе" генератор нагрузки делит GIL с сервером, и RSS включает его самого,
+# поэтому для оценки емкости перед событием используйте --gunicorn. При --workers > 1
+# задайте CHAT_STORE_BACKEND=sqlite, иначе у каждого воркера свой буфер чата.
+# Строки из --log-file при нехватке повторяются по кругу и будут отброшены дедупликацией.
+import argparse
+import base64
+import http.client
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import jwt
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthlog import generate_lines  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    """Процентиль по методу ближайшего ранга; None для пустого списка."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(latencies):
+    values = sorted(latencies)
+    if not values:
+        return {"p50": None, "p99": None, "max": None, "mean": None}
+    return {
+        "p50": round(percentile(values, 0.50) * 1000, 3),
+        "p99": round(percentile(values, 0.99) * 1000, 3),
+        "max": round(values[-1] * 1000, 3),
+        "mean": round(sum(values) / len(values) * 1000, 3),
+    }
+
+
+# --- RSS ---
+
+def _process_rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _child_pids(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as children:
+            return [int(child) for child in children.read().split()]
+    except OSError:
+        return []
+
+
+class RssMonitor:
+    """Периодически суммирует RSS процесса и его прямых потомков (воркеров gunicorn)."""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-monitor', daemon=True)
+
+    def sample(self):
+        total = sum(_process_rss_bytes(pid) for pid in [self.pid] + _child_pids(self.pid))
+        if total:
+            self.samples.append(total)
+        return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def summary(self):
+        if not self.samples:
+            return {"start": None, "peak": None, "end": None}
+        to_mb = lambda value: round(value / (1024 * 1024), 1)  # noqa: E731
+        return {"start": to_mb(self.samples[0]), "peak": to_mb(max(self.samples)), "end": to_mb(self.samples[-1])}
+
+
+# --- Целевой сервер ---
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_ready(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"Сервер {host}:{port} не ответил за {timeout:.0f} с")
+
+
+def start_in_process(secret_b64):
+    os.environ['TWITCH_EXTENSION_SECRET'] = secret_b64
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    from werkzeug.serving import make_server
+    import app as chat_app
+
+    server = make_server('127.0.0.1', 0, chat_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return '127.0.0.1', server.server_port, os.getpid(), server.shutdown
+
+
+def start_gunicorn(secret_b64, workers, worker_class, worker_connections):
+    port = _free_port()
+    env = dict(os.environ, TWITCH_EXTENSION_SECRET=secret_b64)
+    env.setdefault('LOG_LEVEL', 'WARNING')
+    command = [
+        sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers), '--worker-class', worker_class,
+        '--worker-connections', str(worker_connections), '--log-level', 'warning',
+    ]
+    process = subprocess.Popen(command, cwd=REPO_DIR, env=env)
+    try:
+        _wait_until_ready('127.0.0.1', port)
+    except BaseException:
+        process.terminate()
+        raise
+
+    def stop():
+        process.terminate()
+        process.wait(timeout=30)
+    return '127.0.0.1', port, process.pid, stop
+
+
+# --- Нагрузка ---
+
+class RequestStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.statuses = {}
+        self.connection_errors = 0
+
+    def record(self, latency, status):
+        with self._lock:
+            self.latencies.append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def record_connection_error(self):
+        with self._lock:
+            self.connection_errors += 1
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    def errors(self, ok_statuses=(200,)):
+        return self.connection_errors + sum(count for status, count in self.statuses.items() if status not in ok_statuses)
+
+
+def replay_logs(host, port, batches, rate, batch_lines, sender_index, sender_count, started, deadline,
+                stats, headers, run_id, sent_lines):
+    """Отправляет пачки sender_index, sender_index + sender_count, ... по расписанию rate строк/с."""
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    for batch_index in range(sender_index, len(batches), sender_count):
+        scheduled = started + batch_index * batch_lines / rate
+        now = time.perf_counter()
+        if scheduled >= deadline:
+            break
+        if scheduled > now:
+            time.sleep(scheduled - now)
+        request_headers = dict(headers, **{'X-Batch-Id': f'{run_id}-{batch_index}'})
+        request_started = time.perf_counter()
+        try:
+            conn.request('POST', '/gsi', body=batches[batch_index], headers=request_headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            stats.record_connection_error()
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        stats.record(time.perf_counter() - request_started, response.status)
+        if response.status == 200:
+            sent_lines[sender_index] += batch_lines
+    conn.close()
+
+
+def poll_chat(host, port, token, mode, interval, deadline, stats, received):
+    """Один зритель: опрашивает /chat как расширение - инкрементально (since) или с ETag (full)."""
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    headers = {'Authorization': f'Bearer {token}', 'Accept-Encoding': 'gzip'}
+    epoch = cursor = etag = None
+    next_poll = time.perf_counter() + random.random() * interval  # Зрители подключаются вразнобой
+    while True:
+        now = time.perf_counter()
+        if next_poll >= deadline:
+            break
+        if next_poll > now:
+            time.sleep(next_poll - now)
+        next_poll += interval
+        if mode == 'since':
+            path = '/chat?since=0' if cursor is None else f'/chat?since={cursor}&epoch={epoch}'
+            request_headers = headers
+        else:
+            path = '/chat'
+            request_headers = dict(headers, **{'If-None-Match': etag}) if etag else headers
+        request_started = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=request_headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            stats.record_connection_error()
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        stats.record(time.perf_counter() - request_started, response.status)
+        if response.status != 200:
+            continue
+        if mode == 'since':
+            delta = json.loads(body)
+            epoch, cursor = delta['epoch'], delta['head']
+            received[0] += len(delta['messages'])
+        else:
+            etag = response.getheader('ETag')
+            received[0] += 1
+    conn.close()
+
+
+def make_viewer_token(secret, channel_id, viewer_index):
+    now = int(time.time())
+    payload = {
+        "exp": now + 3600,
+        "iat": now,
+        "opaque_user_id": f"UloadTest{viewer_index}",
+        "channel_id": channel_id,
+        "role": "viewer",
+    }
+    return jwt.encode(payload, secret, algorithm='HS256')
+
+
+def load_lines(args, needed):
+    if args.log_file:
+        with open(args.log_file, encoding='utf-8', errors='replace') as log_file:
+            lines = [line.rstrip('\r\n') for line in log_file if line.strip()]
+        if not lines:
+            raise SystemExit(f"В {args.log_file} нет строк")
+        return [lines[i % len(lines)] for i in range(needed)]
+    return generate_lines(needed, chat_ratio=args.chat_ratio, seed=args.seed, clear_ratio=args.clear_ratio)
+
+
+def run(args):
+    if args.url:
+        if not args.secret:
+            raise SystemExit("Для --url нужен --secret (секрет расширения в base64, как TWITCH_EXTENSION_SECRET)")
+        secret_b64 = args.secret
+    else:
+        secret_b64 = base64.b64encode(os.urandom(32)).decode('ascii')  # Локальный тестовый секрет
+    secret = base64.b64decode(secret_b64)
+
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port, server_pid, stop_server, target = parts.hostname, parts.port or 80, None, None, args.url
+    elif args.gunicorn:
+        host, port, server_pid, stop_server = start_gunicorn(
+            secret_b64, args.workers, args.worker_class, args.worker_connections)
+        target = 'gunicorn'
+    else:
+        host, port, server_pid, stop_server = start_in_process(secret_b64)
+        target = 'in-process'
+    print(f"Цель: {target} ({host}:{port}), {args.duration:.0f} с, {args.rate} строк/с, "
+          f"зрителей: {args.pollers}", file=sys.stderr)
+
+    batch_count = int(args.rate * args.duration / args.batch_lines) + 1
+    lines = load_lines(args, batch_count * args.batch_lines)
+    batches = [
+        '\n'.join(lines[i:i + args.batch_lines]).encode('utf-8')
+        for i in range(0, len(lines), args.batch_lines)
+    ]
+    gsi_headers = {'Content-Type': 'text/plain; charset=utf-8'}
+    if args.ingest_key:
+        gsi_headers['X-Ingest-Key'] = args.ingest_key
+
+    rss_monitor = RssMonitor(server_pid) if server_pid else None
+    if rss_monitor:
+        rss_monitor.start()
+    gsi_stats, chat_stats = RequestStats(), RequestStats()
+    sent_lines = [0] * args.senders
+    received = [[0] for _viewer in range(args.pollers)]  # Счетчик полученного у каждого зрителя
+    run_id = uuid.uuid4().hex[:8]
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=replay_logs, args=(
+            host, port, batches, args.rate, args.batch_lines, index, args.senders, started, deadline,
+            gsi_stats, gsi_headers, run_id, sent_lines))
+        for index in range(args.senders)
+    ]
+    for viewer_index in range(args.pollers):
+        token = make_viewer_token(secret, args.channel_id, viewer_index)
+        threads.append(threading.Thread(target=poll_chat, args=(
+            host, port, token, args.mode, args.poll_interval, deadline, chat_stats, received[viewer_index])))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    if rss_monitor:
+        rss_monitor.stop()
+    if stop_server:
+        stop_server()
+
+    return {
+        "target": target,
+        "config": {
+            "duration_s": args.duration,
+            "target_lines_per_s": args.rate,
+            "batch_lines": args.batch_lines,
+            "senders": args.senders,
+            "pollers": args.pollers,
+            "poll_interval_s": args.poll_interval,
+            "poll_mode": args.mode,
+            "chat_ratio": None if args.log_file else args.chat_ratio,
+            "clear_ratio": None if args.log_file else args.clear_ratio,
+            "log_file": args.log_file,
+            "workers": args.workers if args.gunicorn else None,
+            "worker_class": args.worker_class if args.gunicorn else None,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "gsi": {
+            "requests": gsi_stats.requests,
+            "errors": gsi_stats.errors(),
+            "statuses": {str(status): count for status, count in sorted(gsi_stats.statuses.items())},
+            "lines_sent": sum(sent_lines),
+            "lines_per_s": round(sum(sent_lines) / elapsed, 1),
+            "requests_per_s": round(gsi_stats.requests / elapsed, 1),
+            "latency_ms": latency_summary(gsi_stats.latencies),
+        },
+        "chat": {
+            "requests": chat_stats.requests,
+            "errors": chat_stats.errors(ok_statuses=(200, 304)),
+            "statuses": {str(status): count for status, count in sorted(chat_stats.statuses.items())},
+            "requests_per_s": round(chat_stats.requests / elapsed, 1),
+            "messages_received": sum(counter[0] for counter in received),
+            "latency_ms": latency_summary(chat_stats.latencies),
+        },
+        "rss_mb": rss_monitor.summary() if rss_monitor else None,
+        "rss_includes_load_generator": target == 'in-process',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /gsi и /chat")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--gunicorn', action='store_true', help="запустить app:app под gunicorn на localhost")
+    target.add_argument('--url', help="уже запущенный сервер, например http://127.0.0.1:8080")
+    parser.add_argument('--secret', help="секрет расширения в base64 (только с --url)")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--worker-class', default='gevent')
+    parser.add_argument('--worker-connections', type=int, default=2000)
+    parser.add_argument('--duration', type=float, default=20.0, help="длительность, с")
+    parser.add_argument('--rate', type=int, default=2000, help="целевая скорость воспроизведения, строк/с")
+    parser.add_argument('--batch-lines', type=int, default=100, help="строк в одном запросе /gsi")
+    parser.add_argument('--senders', type=int, default=1, help="параллельных отправителей /gsi")
+    parser.add_argument('--log-file', help="файл лога для воспроизведения (по умолчанию - синтетический)")
+    parser.add_argument('--chat-ratio', type=float, default=0.04, help="доля строк чата в синтетическом логе")
+    parser.add_argument('--clear-ratio', type=float, default=0.0,
+                        help="доля сообщений чата с очисткой !team1 в синтетическом логе (по умолчанию 0)")
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--ingest-key', help="значение X-Ingest-Key для /gsi")
+    parser.add_argument('--channel-id', default='default', help="channel_id в JWT зрителей")
+    parser.add_argument('--pollers', type=int, default=50, help="число зрителей, опрашивающих /chat")
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="интервал опроса одного зрителя, с")
+    parser.add_argument('--mode', choices=('since', 'full'), default='since',
+                        help="since - инкрементальный /chat?since=, full - полный список с If-None-Match")
+    parser.add_argument('--output', help="дополнительно записать JSON-результат в файл")
+    args = parser.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Файл: bench/synthlog.py
+# Генератор синтетических логов CS2 для бенчмарков.
+# Запуск: python bench/synthlog.py <кол-во строк> [доля чата] > match.log
+import random
+import sys
+
+PLAYER_NAMES = ["s1mple", "ZywOo", "NiKo", "m0NESY", "donk", "ropz", "electroNic", "Ax1Le"]
+# Имена и фразы не в ASCII: кириллица, CJK, эмодзи, HTML-символы и кавычки.
+UNICODE_PLAYER_NAMES = ["Саша <3", "小明", "ジョン", "Ёжик™", "🔥donk🔥", "Çağrı", "x'\"quote", "Łukasz & co"]
+CHAT_PHRASES = ["gg", "nice shot", "eco this round", "rush B", "wp", "save", "one tap",
+                "го на б", "красава 👍", "加油", "なんで", "<b>not html</b>", "\"quoted\" text"]
+WEAPONS = ["ak47", "m4a1_silencer", "awp", "deagle", "usp_silencer", "glock"]
+
+
+def _player_name(rng):
+    # Примерно каждое четвертое имя - не ASCII.
+    return rng.choice(UNICODE_PLAYER_NAMES) if rng.random() < 0.25 else rng.choice(PLAYER_NAMES)
+
+
+def _player_block(rng, userid):
+    name = _player_name(rng)
+    team = rng.choice(["CT", "TERRORIST"])
+    return f'"{name}<{userid}><[U:1:{100000 + userid}]><{team}>"'
+
+
+def generate_lines(count, chat_ratio=0.04, seed=1234, clear_ratio=0.0):
+    """Возвращает список из count строк лога, доля строк чата примерно chat_ratio.
+
+    clear_ratio - доля сообщений чата с командой очистки !team1 (по умолчанию очисток нет:
+    в реальной трансляции это редкая ручная команда).
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        ts = f"10/17/2026 - {12 + i // 3600000 % 12:02d}:{i // 60000 % 60:02d}:{i // 1000 % 60:02d}.{i % 1000:03d}"
+        userid = rng.randint(2, 11)
+        roll = rng.random()
+        if roll < chat_ratio:
+            command = "say" if rng.random() < 0.7 else "say_team"
+            phrase = "!team1 reset" if rng.random() < clear_ratio else rng.choice(CHAT_PHRASES)
+            lines.append(f'{ts} - {_player_block(rng, userid)} {command} "{phrase}"')
+        elif roll < 0.5:
+            victim = _player_block(rng, rng.randint(2, 11))
+            lines.append(
+                f'{ts} - {_player_block(rng, userid)} [-1021 1240 -95] killed {victim} '
+                f'[-900 1300 -95] with "{rng.choice(WEAPONS)}"'
+            )
+        elif roll < 0.8:
+            lines.append(
+                f'{ts} - {_player_block(rng, userid)} [-1021 1240 -95] attacked '
+                f'{_player_block(rng, rng.randint(2, 11))} [-900 1300 -95] with "{rng.choice(WEAPONS)}" '
+                f'(damage "27") (damage_armor "3") (health "73") (armor "97") (hitgroup "chest")'
+            )
+        elif roll < 0.9:
+            lines.append(f'{ts} - {_player_block(rng, userid)} purchased "{rng.choice(WEAPONS)}"')
+        elif roll < 0.95:
+            lines.append(f'{ts} - World triggered "{rng.choice(["Round_Start", "Round_End"])}"')
+        else:
+            name = _player_name(rng)
+            lines.append(f'{ts} - "{name}<{userid}><[U:1:{100000 + userid}]>" switched from team <CT> to <TERRORIST>')
+    return lines
+
+
+if __name__ == '__main__':
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.04
+    sys.stdout.reconfigure(encoding='utf-8')
+    for log_line in generate_lines(line_count, chat_ratio=ratio):
+        sys.stdout.write(log_line + '\n')
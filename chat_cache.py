@@ -0,0 +1,52 @@
+# Файл: chat_cache.py
+# Кэш предварительно сериализованного снимка чата для /chat.
+import gzip
+import json
+import threading
+from collections import namedtuple
+
+# body - JSON в байтах, body_gzip - его сжатая копия; etag и etag_gzip - сильные ETag
+# (без кавычек) каждого из представлений: разные кодировки должны иметь разные валидаторы.
+ChatSnapshot = namedtuple('ChatSnapshot', ['etag', 'etag_gzip', 'body', 'body_gzip', 'count'])
+
+
+class ChatSnapshotCache:
+    """Хранит JSON-снимок хранилища чата, пересобирая его только после записи.
+
+    Снимок привязан к версии хранилища (epoch, head), поэтому запись из другого
+    воркера (общее хранилище) тоже делает его устаревшим. invalidate() вызывается
+    при записи в этом процессе; все чтения между записями отдают одни и те же байты
+    без повторного кодирования и сжатия.
+    """
+
+    def __init__(self, store, gzip_level=6):
+        self._store = store
+        self._gzip_level = gzip_level
+        self._lock = threading.Lock()
+        self._entry = (None, None)  # (версия хранилища, снимок) - заменяется целиком
+
+    def invalidate(self):
+        self._entry = (None, None)
+
+    def get(self):
+        version = self._store.version()
+        cached_version, snapshot = self._entry
+        if cached_version == version:
+            return snapshot
+        with self._lock:
+            # Другой поток мог уже пересобрать снимок, пока мы ждали блокировку.
+            cached_version, snapshot = self._entry
+            if cached_version == version:
+                return snapshot
+            epoch, head, messages = self._store.snapshot()
+            body = json.dumps(messages, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            snapshot = ChatSnapshot(
+                etag=f"{epoch}-{head}",
+                etag_gzip=f"{epoch}-{head}-gz",
+                body=body,
+                body_gzip=gzip.compress(body, compresslevel=self._gzip_level),
+                count=len(messages)
+            )
+            # Ключом служит версия самого снимка: запись между version() и snapshot() не потеряется.
+            self._entry = ((epoch, head), snapshot)
+            return snapshot
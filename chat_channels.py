@@ -0,0 +1,102 @@
+# Файл: chat_channels.py
+# Реестр чатов по каналам Twitch: у каждого канала свой буфер, кэш снимка и SSE-рассылка.
+import threading
+from collections import OrderedDict, deque
+
+from chat_cache import ChatSnapshotCache
+from chat_stream import ChatBroadcaster
+from dedup import RecentKeySet
+
+DEFAULT_CHANNEL_ID = 'default'
+
+
+def parse_ingest_keys(value):
+    """Разбирает GSI_INGEST_KEYS вида "key1:channel1,key2:channel2" в словарь ключ -> channel_id."""
+    ingest_keys = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        key, sep, channel_id = item.partition(':')
+        if not sep or not key.strip() or not channel_id.strip():
+            raise ValueError(f"Некорректная запись в GSI_INGEST_KEYS: {item!r}, ожидалось 'ключ:channel_id'")
+        ingest_keys[key.strip()] = channel_id.strip()
+    return ingest_keys
+
+
+class ChatChannel:
+    """Чат одного канала. ingest_lock сериализует прием логов только внутри канала.
+
+    Ключи принятых строк чата и ID пачек хранит store (для sqlite - общая база воркеров).
+    game_events - последние игровые события (убийства, раунды, смена команды) для оверлея;
+    они живут в памяти процесса, поэтому и их ключи (seen_events) тоже.
+    """
+
+    def __init__(self, channel_id, store, heartbeat_interval, dedup_max_keys=20000, dedup_window=600.0,
+                 max_game_events=50):
+        self.channel_id = channel_id
+        self.store = store
+        self.snapshot_cache = ChatSnapshotCache(store)
+        self.broadcaster = ChatBroadcaster(store, heartbeat_interval=heartbeat_interval)
+        self.ingest_lock = threading.Lock()
+        self.game_events = deque(maxlen=max_game_events)
+        self.seen_events = RecentKeySet(maxsize=dedup_max_keys, window=dedup_window)
+
+
+class ChannelRegistry:
+    """LRU-реестр каналов с ограничением на их количество.
+
+    При превышении max_channels вытесняются давно не используемые каналы без
+    SSE-подписчиков. Блокировка реестра держится только на время поиска/создания
+    канала; прием логов и чтение чата идут под блокировками самого канала.
+    """
+
+    def __init__(self, store_factory, max_channels=500, heartbeat_interval=15.0,
+                 dedup_max_keys=20000, dedup_window=600.0, max_game_events=50):
+        self._store_factory = store_factory
+        self.max_channels = max_channels
+        self._heartbeat_interval = heartbeat_interval
+        self._dedup_max_keys = dedup_max_keys
+        self._dedup_window = dedup_window
+        self._max_game_events = max_game_events
+        self._lock = threading.Lock()
+        self._channels = OrderedDict()  # channel_id -> ChatChannel
+
+    def __len__(self):
+        return len(self._channels)
+
+    def channels(self):
+        """Снимок списка каналов (для метрик)."""
+        with self._lock:
+            return list(self._channels.values())
+
+    def get(self, channel_id, create=True):
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is not None:
+                self._channels.move_to_end(channel_id)
+                return channel
+            if not create:
+                return None
+            channel = ChatChannel(
+                channel_id, self._store_factory(channel_id), self._heartbeat_interval,
+                dedup_max_keys=self._dedup_max_keys, dedup_window=self._dedup_window,
+                max_game_events=self._max_game_events
+            )
+            self._channels[channel_id] = channel
+            self._evict_idle()
+            return channel
+
+    def _evict_idle(self):
+        excess = len(self._channels) - self.max_channels
+        if excess <= 0:
+            return
+        for channel_id in list(self._channels)[:-1]:  # только что созданный канал не трогаем
+            if excess <= 0:
+                break
+            channel = self._channels[channel_id]
+            if channel.broadcaster.subscriber_count == 0 and not channel.ingest_lock.locked():
+                del self._channels[channel_id]
+                channel.broadcaster.close()
+                channel.store.close()
+                excess -= 1
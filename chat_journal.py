@@ -0,0 +1,348 @@
+# Файл: chat_journal.py
+# Журнал сообщений чата на диске: восстановление буфера после перезапуска и постраничная история.
+import json
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+# Запись в .log: заголовок (длина, crc32 тела) + тело JSON.
+_RECORD_HEADER = struct.Struct('<II')
+# Запись в .idx: ID сообщения, смещение записи в .log, флаги. ID в индексе не убывают.
+_INDEX_ENTRY = struct.Struct('<QQI')
+FLAG_CLEAR = 1
+
+_SEGMENT_NAME = re.compile(r'^(\d{8})\.log$')
+
+
+def channel_journal_dir(base_dir, channel_id):
+    """Каталог журнала канала; небезопасные для имени файла channel_id кодируются в hex."""
+    if re.fullmatch(r'[A-Za-z0-9_-]{1,64}', channel_id):
+        name = channel_id
+    else:
+        name = 'x' + channel_id.encode('utf-8').hex()[:120]
+    return os.path.join(base_dir, name)
+
+
+class _Segment:
+    def __init__(self, directory, number):
+        self.number = number
+        self.log_path = os.path.join(directory, f"{number:08d}.log")
+        self.idx_path = os.path.join(directory, f"{number:08d}.idx")
+        self.first_id = None  # ID первой записи, None - сегмент пуст
+
+
+class ChatJournal:
+    """Журнал только для добавления, разбитый на сегменты.
+
+    Каждая запись в .log предваряется длиной и CRC32, для каждой записи в .idx
+    пишется запись фиксированной длины (ID, смещение, флаги), поэтому поиск по ID
+    и чтение страницы истории делаются через seek, без чтения сегмента целиком.
+    После каждой записи данные сбрасываются в ОС (flush); fsync выполняется
+    пачками: каждые fsync_every записей или не реже раза в fsync_interval секунд
+    при следующей записи. Сегмент закрывается по достижении segment_bytes;
+    хранится не больше max_segments сегментов.
+    """
+
+    def __init__(self, directory, segment_bytes=8 * 1024 * 1024, max_segments=64,
+                 fsync_every=64, fsync_interval=1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._log_file = None
+        self._idx_file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        self._segments = []
+        for name in sorted(os.listdir(directory)):
+            match = _SEGMENT_NAME.match(name)
+            if match:
+                self._segments.append(_Segment(directory, int(match.group(1))))
+        for segment in self._segments:
+            segment.first_id = self._read_first_id(segment)
+        if self._segments:
+            self._repair_tail(self._segments[-1])
+
+    # --- Чтение низкого уровня ---
+
+    @staticmethod
+    def _read_entry(idx_file, position):
+        idx_file.seek(position * _INDEX_ENTRY.size)
+        data = idx_file.read(_INDEX_ENTRY.size)
+        if len(data) < _INDEX_ENTRY.size:
+            return None
+        return _INDEX_ENTRY.unpack(data)
+
+    @staticmethod
+    def _iter_entries_reversed(idx_file, end, block=1024):
+        """Записи индекса с позиции end-1 к началу; читается блоками по block записей."""
+        while end > 0:
+            start = max(0, end - block)
+            idx_file.seek(start * _INDEX_ENTRY.size)
+            data = idx_file.read((end - start) * _INDEX_ENTRY.size)
+            entries = list(_INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % _INDEX_ENTRY.size]))
+            yield from reversed(entries)
+            end = start
+
+    @staticmethod
+    def _entry_count(idx_file):
+        idx_file.seek(0, os.SEEK_END)
+        return idx_file.tell() // _INDEX_ENTRY.size
+
+    @staticmethod
+    def _read_record(log_file, offset):
+        """Читает запись по смещению. None, если запись неполная или повреждена."""
+        log_file.seek(offset)
+        header = log_file.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            return None
+        length, crc = _RECORD_HEADER.unpack(header)
+        body = log_file.read(length)
+        if len(body) < length or zlib.crc32(body) != crc:
+            return None
+        return json.loads(body)
+
+    def _read_first_id(self, segment):
+        try:
+            with open(segment.idx_path, 'rb') as idx_file:
+                entry = self._read_entry(idx_file, 0)
+        except FileNotFoundError:
+            return None
+        return entry[0] if entry else None
+
+    def _repair_tail(self, segment):
+        """Обрезает недописанный хвост последнего сегмента (сбой посреди записи)."""
+        if not os.path.exists(segment.idx_path):
+            open(segment.idx_path, 'wb').close()
+        if not os.path.exists(segment.log_path):
+            open(segment.log_path, 'wb').close()
+        with open(segment.idx_path, 'r+b') as idx_file, open(segment.log_path, 'r+b') as log_file:
+            count = self._entry_count(idx_file)
+            log_end = 0
+            while count > 0:
+                _record_id, offset, _flags = self._read_entry(idx_file, count - 1)
+                if self._read_record(log_file, offset) is not None:
+                    log_end = log_file.tell()
+                    break
+                count -= 1
+            idx_file.truncate(count * _INDEX_ENTRY.size)
+            log_file.truncate(log_end)
+        if count == 0:
+            segment.first_id = None
+
+    # --- Запись ---
+
+    def _open_for_append(self):
+        if not self._segments:
+            self._segments.append(_Segment(self.directory, 1))
+        segment = self._segments[-1]
+        self._log_file = open(segment.log_path, 'ab')
+        self._idx_file = open(segment.idx_path, 'ab')
+
+    def _rotate(self):
+        self._sync()
+        self._log_file.close()
+        self._idx_file.close()
+        self._segments.append(_Segment(self.directory, self._segments[-1].number + 1))
+        while len(self._segments) > self.max_segments:
+            old = self._segments.pop(0)
+            for path in (old.log_path, old.idx_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self._open_for_append()
+
+    def _sync(self):
+        if self._log_file is None or not self._unsynced:
+            return
+        os.fsync(self._log_file.fileno())
+        os.fsync(self._idx_file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _append(self, record_id, flags, payload):
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with self._lock:
+            if self._log_file is None:
+                self._open_for_append()
+            elif self._log_file.tell() >= self.segment_bytes:
+                self._rotate()
+            segment = self._segments[-1]
+            offset = self._log_file.tell()
+            self._log_file.write(_RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body)
+            self._log_file.flush()
+            # Индекс пишется после записи: при сбое между ними хвост .log обрежется при открытии.
+            self._idx_file.write(_INDEX_ENTRY.pack(record_id, offset, flags))
+            self._idx_file.flush()
+            if segment.first_id is None:
+                segment.first_id = record_id
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def append_message(self, epoch, message):
+        self._append(message["id"], 0, {"e": epoch, "m": message})
+
+    def append_clear(self, epoch, head):
+        self._append(head, FLAG_CLEAR, {"e": epoch, "c": head})
+
+    def close(self):
+        with self._lock:
+            if self._log_file is not None:
+                self._sync()
+                self._log_file.close()
+                self._idx_file.close()
+                self._log_file = self._idx_file = None
+
+    # --- Восстановление и история ---
+
+    def recover(self, maxlen):
+        """Восстанавливает состояние буфера по хвосту журнала.
+
+        Возвращает (epoch, head, epoch_start_id, messages) или None для пустого журнала.
+        Индекс читается с конца до последней очистки или до maxlen сообщений,
+        затем читаются только нужные записи. Если очистка не найдена в этом окне,
+        началом эпохи считается самое старое восстановленное сообщение: клиенты
+        с более старым курсором получат полный список (reset).
+        """
+        with self._lock:
+            segments = [segment for segment in self._segments if segment.first_id is not None]
+        head = epoch = None
+        epoch_start_id = None
+        wanted = []  # (сегмент, смещение, ID) от новых к старым
+        for segment in reversed(segments):
+            with open(segment.idx_path, 'rb') as idx_file:
+                for record_id, offset, flags in self._iter_entries_reversed(idx_file, self._entry_count(idx_file)):
+                    if head is None:
+                        head = record_id
+                        with open(segment.log_path, 'rb') as log_file:
+                            record = self._read_record(log_file, offset)
+                        epoch = record["e"] if record else None
+                    if flags & FLAG_CLEAR:
+                        epoch_start_id = record_id + 1
+                        break
+                    # В буфере ID идут подряд: на разрыве (потерянные записи) останавливаемся.
+                    expected_id = wanted[-1][2] - 1 if wanted else head
+                    if record_id != expected_id or len(wanted) >= maxlen:
+                        epoch_start_id = wanted[-1][2] if wanted else head + 1
+                        break
+                    wanted.append((segment, offset, record_id))
+            if epoch_start_id is not None:
+                break
+        if head is None or epoch is None:
+            return None
+        if epoch_start_id is None:
+            epoch_start_id = wanted[-1][2] if wanted else head + 1
+        messages = self._read_messages((segment, offset) for segment, offset, _id in reversed(wanted))
+        return epoch, head, epoch_start_id, messages
+
+    def _read_messages(self, locations):
+        messages = []
+        open_files = {}
+        try:
+            for segment, offset in locations:
+                log_file = open_files.get(segment.number)
+                if log_file is None:
+                    log_file = open_files[segment.number] = open(segment.log_path, 'rb')
+                record = self._read_record(log_file, offset)
+                if record is not None and "m" in record:
+                    messages.append(record["m"])
+        finally:
+            for log_file in open_files.values():
+                log_file.close()
+        return messages
+
+    @staticmethod
+    def _bisect_before(idx_file, before):
+        """Позиция первой записи индекса с ID >= before (двоичный поиск через seek)."""
+        low, high = 0, ChatJournal._entry_count(idx_file)
+        while low < high:
+            middle = (low + high) // 2
+            if ChatJournal._read_entry(idx_file, middle)[0] < before:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def read_before(self, before, limit):
+        """Возвращает до limit сообщений с ID < before в порядке возрастания ID."""
+        with self._lock:
+            segments = [segment for segment in self._segments if segment.first_id is not None]
+        wanted = []
+        try:
+            for segment in reversed(segments):
+                if segment.first_id >= before:
+                    continue
+                with open(segment.idx_path, 'rb') as idx_file:
+                    end = self._bisect_before(idx_file, before)
+                    for _record_id, offset, flags in self._iter_entries_reversed(idx_file, end, block=limit + 1):
+                        if not flags & FLAG_CLEAR:
+                            wanted.append((segment, offset))
+                            if len(wanted) >= limit:
+                                break
+                if len(wanted) >= limit:
+                    break
+            return self._read_messages(reversed(wanted))
+        except FileNotFoundError:
+            return []  # Сегмент удален ротацией во время чтения
+
+
+class JournaledChatStore:
+    """Обертка над хранилищем в памяти: пишет каждое изменение в ChatJournal
+    и при создании восстанавливает буфер из хвоста журнала."""
+
+    shared = False
+
+    def __init__(self, store, journal):
+        self._store = store
+        self.journal = journal
+        self.maxlen = store.maxlen
+        started = time.perf_counter()
+        state = journal.recover(store.maxlen)
+        if state is not None:
+            store.restore(*state)
+        self.recovery_seconds = time.perf_counter() - started
+
+    def __len__(self):
+        return len(self._store)
+
+    def append(self, message, dedup_key=None):
+        message_id = self._store.append(message, dedup_key)
+        if message_id is not None:
+            self.journal.append_message(self._store.version()[0], message)
+        return message_id
+
+    def clear(self, dedup_key=None):
+        if not self._store.clear(dedup_key):
+            return False
+        epoch, head = self._store.version()
+        self.journal.append_clear(epoch, head)
+        return True
+
+    def remember(self, dedup_key):
+        return self._store.remember(dedup_key)
+
+    def seen(self, dedup_key):
+        return self._store.seen(dedup_key)
+
+    def version(self):
+        return self._store.version()
+
+    def snapshot(self):
+        return self._store.snapshot()
+
+    def since(self, cursor, epoch=None):
+        return self._store.since(cursor, epoch)
+
+    def history(self, before, limit):
+        return self.journal.read_before(before, limit)
+
+    def close(self):
+        self.journal.close()
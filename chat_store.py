@@ -0,0 +1,310 @@
+# Файл: chat_store.py
+# Хранилище сообщений чата с монотонными ID и эпохами очистки.
+import json
+import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from itertools import islice
+
+from dedup import RecentKeySet
+
+# Результат инкрементального запроса: эпоха, ID последнего сообщения,
+# новые сообщения и флаг сброса (клиент должен заменить весь свой список).
+ChatDelta = namedtuple('ChatDelta', ['epoch', 'head', 'messages', 'reset'])
+
+
+def _needs_reset(cursor, epoch, current_epoch, head, epoch_start_id, oldest_id):
+    """Общее для хранилищ правило: должен ли клиент с (cursor, epoch) заменить весь список."""
+    if epoch is None:
+        if cursor < epoch_start_id:
+            return True  # Эпоха клиента неизвестна: очистка могла пройти мимо него
+    elif epoch != current_epoch:
+        return True
+    return cursor < oldest_id - 1 or cursor > head
+
+
+class ChatStore:
+    """Кольцевой буфер сообщений чата в памяти процесса.
+
+    Каждому сообщению присваивается монотонно растущий ID. Очистка (команда !team1)
+    начинает новую эпоху; ID при этом не сбрасываются. Начальная эпоха берется
+    из времени запуска, чтобы клиенты замечали перезапуск сервера.
+
+    Ключи дедупликации (dedup.dedup_key) помнятся dedup_window секунд вместе с сообщениями:
+    append/clear/remember с уже виденным ключом ничего не меняют.
+    """
+
+    # Хранилище видно только текущему процессу.
+    shared = False
+
+    def __init__(self, maxlen, dedup_max_keys=20000, dedup_window=600.0):
+        self.maxlen = maxlen
+        self._messages = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._epoch = int(time.time() * 1000)
+        self._epoch_start_id = 1  # ID первого сообщения текущей эпохи
+        self._seen_keys = RecentKeySet(maxsize=dedup_max_keys, window=dedup_window)
+
+    def __len__(self):
+        return len(self._messages)
+
+    def append(self, message, dedup_key=None):
+        """Добавляет сообщение (dict), проставляет ему поле "id" и возвращает этот ID.
+
+        Если dedup_key уже встречался, сообщение не добавляется и возвращается None.
+        """
+        with self._lock:
+            if dedup_key is not None and not self._seen_keys.add(dedup_key):
+                return None
+            self._last_id += 1
+            message["id"] = self._last_id
+            self._messages.append(message)
+            return self._last_id
+
+    def clear(self, dedup_key=None):
+        """Очищает буфер и начинает новую эпоху. Возвращает False, если dedup_key уже встречался."""
+        with self._lock:
+            if dedup_key is not None and not self._seen_keys.add(dedup_key):
+                return False
+            self._messages.clear()
+            self._epoch += 1
+            self._epoch_start_id = self._last_id + 1
+            return True
+
+    def remember(self, dedup_key):
+        """Запоминает ключ без изменения буфера. Возвращает False, если он уже встречался."""
+        return self._seen_keys.add(dedup_key)
+
+    def seen(self, dedup_key):
+        return dedup_key in self._seen_keys
+
+    def version(self):
+        """Возвращает (epoch, head): меняется при любой записи в хранилище."""
+        return self._epoch, self._last_id
+
+    def snapshot(self):
+        """Возвращает (epoch, head, список всех сообщений)."""
+        with self._lock:
+            return self._epoch, self._last_id, list(self._messages)
+
+    def since(self, cursor, epoch=None):
+        """Возвращает ChatDelta с сообщениями, у которых ID больше cursor.
+
+        Если клиент пришел с чужой эпохой, с курсором из будущего (перезапуск сервера)
+        или старше самого старого сообщения в буфере (часть сообщений уже вытеснена),
+        возвращается весь буфер с reset=True. Клиент без epoch получает reset при любом
+        курсоре до начала текущей эпохи: иначе очистку, случившуюся сразу после его
+        последнего запроса, не отличить от отсутствия новых сообщений.
+        """
+        with self._lock:
+            head = self._last_id
+            oldest_id = self._messages[0]["id"] if self._messages else self._epoch_start_id
+            if _needs_reset(cursor, epoch, self._epoch, head, self._epoch_start_id, oldest_id):
+                return ChatDelta(self._epoch, head, list(self._messages), True)
+            if cursor == head or not self._messages:
+                return ChatDelta(self._epoch, head, [], False)
+            # ID в буфере идут подряд, поэтому позиция вычисляется без перебора.
+            start = cursor - oldest_id + 1
+            return ChatDelta(self._epoch, head, list(islice(self._messages, start, None)), False)
+
+    def restore(self, epoch, head, epoch_start_id, messages):
+        """Восстанавливает состояние (например, из журнала после перезапуска).
+
+        messages должны идти подряд по ID и заканчиваться на head.
+        """
+        with self._lock:
+            self._epoch = epoch
+            self._last_id = head
+            self._epoch_start_id = epoch_start_id
+            self._messages.clear()
+            self._messages.extend(messages)
+
+    def close(self):
+        pass  # Буфер в памяти не держит внешних ресурсов
+
+
+class _SqliteDatabase:
+    """Одно соединение SQLite на файл и процесс, общее для всех каналов."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock, self.transaction():
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_messages ("
+                "channel_id TEXT NOT NULL, id INTEGER NOT NULL, body TEXT NOT NULL, "
+                "PRIMARY KEY (channel_id, id)) WITHOUT ROWID"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_state ("
+                "channel_id TEXT PRIMARY KEY, "
+                "epoch INTEGER NOT NULL, last_id INTEGER NOT NULL, epoch_start_id INTEGER NOT NULL)"
+            )
+            # Ключи дедупликации приема логов: общие для воркеров, поэтому повтор пачки,
+            # попавший на другой воркер, тоже распознается.
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_dedup_keys ("
+                "channel_id TEXT NOT NULL, key BLOB NOT NULL, added_at REAL NOT NULL, "
+                "PRIMARY KEY (channel_id, key)) WITHOUT ROWID"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS chat_dedup_keys_added_at ON chat_dedup_keys (channel_id, added_at)"
+            )
+
+    @contextmanager
+    def transaction(self, write=True):
+        # IMMEDIATE сразу берет блокировку записи и не дает двум воркерам выдать один ID.
+        self.conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+
+_sqlite_databases = {}
+_sqlite_databases_lock = threading.Lock()
+
+
+def _open_sqlite_database(path):
+    with _sqlite_databases_lock:
+        database = _sqlite_databases.get(path)
+        if database is None:
+            database = _sqlite_databases[path] = _SqliteDatabase(path)
+        return database
+
+
+class SqliteChatStore:
+    """Кольцевой буфер сообщений чата в SQLite (режим WAL), общий для всех воркеров gunicorn.
+
+    Семантика совпадает с ChatStore: монотонные ID, эпохи очистки и ограничение
+    maxlen. Счетчики хранятся в той же базе, поэтому любой процесс выдает
+    согласованные ID. Каналы живут в одном файле и различаются по channel_id.
+    Ключи дедупликации пишутся в ту же транзакцию, что и сообщение, и видны всем
+    воркерам; записи старше dedup_window удаляются при добавлении новых.
+    Файл базы должен лежать на локальном диске.
+    """
+
+    shared = True
+
+    def __init__(self, path, maxlen, channel_id='default', dedup_window=600.0):
+        self.path = path
+        self.maxlen = maxlen
+        self.channel_id = channel_id
+        self.dedup_window = dedup_window
+        self._db = _open_sqlite_database(path)
+        with self._db.lock, self._db.transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO chat_state (channel_id, epoch, last_id, epoch_start_id) VALUES (?, ?, 0, 1)",
+                (channel_id, int(time.time() * 1000))
+            )
+
+    def _state(self, conn):
+        return conn.execute(
+            "SELECT epoch, last_id, epoch_start_id FROM chat_state WHERE channel_id = ?", (self.channel_id,)
+        ).fetchone()
+
+    def __len__(self):
+        with self._db.lock:
+            return self._db.conn.execute(
+                "SELECT COUNT(*) FROM chat_messages WHERE channel_id = ?", (self.channel_id,)
+            ).fetchone()[0]
+
+    def _add_key(self, conn, dedup_key):
+        # Время стенное, а не monotonic: ключи сверяют разные процессы.
+        now = time.time()
+        conn.execute(
+            "DELETE FROM chat_dedup_keys WHERE channel_id = ? AND added_at <= ?",
+            (self.channel_id, now - self.dedup_window)
+        )
+        return conn.execute(
+            "INSERT OR IGNORE INTO chat_dedup_keys (channel_id, key, added_at) VALUES (?, ?, ?)",
+            (self.channel_id, dedup_key, now)
+        ).rowcount == 1
+
+    def append(self, message, dedup_key=None):
+        with self._db.lock, self._db.transaction() as conn:
+            if dedup_key is not None and not self._add_key(conn, dedup_key):
+                return None
+            message_id = self._state(conn)[1] + 1
+            message["id"] = message_id
+            conn.execute("UPDATE chat_state SET last_id = ? WHERE channel_id = ?", (message_id, self.channel_id))
+            conn.execute(
+                "INSERT INTO chat_messages (channel_id, id, body) VALUES (?, ?, ?)",
+                (self.channel_id, message_id, json.dumps(message, ensure_ascii=False))
+            )
+            conn.execute(
+                "DELETE FROM chat_messages WHERE channel_id = ? AND id <= ?",
+                (self.channel_id, message_id - self.maxlen)
+            )
+            return message_id
+
+    def clear(self, dedup_key=None):
+        with self._db.lock, self._db.transaction() as conn:
+            if dedup_key is not None and not self._add_key(conn, dedup_key):
+                return False
+            conn.execute("DELETE FROM chat_messages WHERE channel_id = ?", (self.channel_id,))
+            conn.execute(
+                "UPDATE chat_state SET epoch = epoch + 1, epoch_start_id = last_id + 1 WHERE channel_id = ?",
+                (self.channel_id,)
+            )
+            return True
+
+    def remember(self, dedup_key):
+        with self._db.lock, self._db.transaction() as conn:
+            return self._add_key(conn, dedup_key)
+
+    def seen(self, dedup_key):
+        with self._db.lock:
+            return self._db.conn.execute(
+                "SELECT 1 FROM chat_dedup_keys WHERE channel_id = ? AND key = ? AND added_at > ?",
+                (self.channel_id, dedup_key, time.time() - self.dedup_window)
+            ).fetchone() is not None
+
+    def version(self):
+        with self._db.lock:
+            epoch, head, _epoch_start_id = self._state(self._db.conn)
+            return epoch, head
+
+    def _messages_after(self, conn, cursor):
+        rows = conn.execute(
+            "SELECT body FROM chat_messages WHERE channel_id = ? AND id > ? ORDER BY id", (self.channel_id, cursor)
+        )
+        return [json.loads(body) for (body,) in rows]
+
+    def snapshot(self):
+        with self._db.lock, self._db.transaction(write=False) as conn:
+            epoch, head, _epoch_start_id = self._state(conn)
+            return epoch, head, self._messages_after(conn, 0)
+
+    def since(self, cursor, epoch=None):
+        with self._db.lock, self._db.transaction(write=False) as conn:
+            current_epoch, head, epoch_start_id = self._state(conn)
+            # append() хранит только последние maxlen ID, поэтому старейший ID вычисляется без запроса.
+            oldest_id = max(epoch_start_id, head - self.maxlen + 1)
+            if _needs_reset(cursor, epoch, current_epoch, head, epoch_start_id, oldest_id):
+                return ChatDelta(current_epoch, head, self._messages_after(conn, 0), True)
+            if cursor == head:
+                return ChatDelta(current_epoch, head, [], False)
+            return ChatDelta(current_epoch, head, self._messages_after(conn, cursor), False)
+
+    def close(self):
+        pass  # Соединение общее для всех каналов файла и живет до конца процесса
+
+
+def create_chat_store(backend, maxlen, path=None, channel_id='default', dedup_max_keys=20000, dedup_window=600.0):
+    """Создает хранилище чата канала: 'memory' (один процесс) или 'sqlite' (несколько воркеров)."""
+    if backend == 'memory':
+        return ChatStore(maxlen, dedup_max_keys=dedup_max_keys, dedup_window=dedup_window)
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError("Для хранилища 'sqlite' нужен путь к файлу базы")
+        return SqliteChatStore(path, maxlen, channel_id, dedup_window=dedup_window)
+    raise ValueError(f"Неизвестный тип хранилища чата: {backend!r}")
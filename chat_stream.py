@@ -0,0 +1,135 @@
+# Файл: chat_stream.py
+# Server-Sent Events для чата: один общий broadcaster на все подключения канала.
+import json
+import threading
+from collections import OrderedDict
+
+
+def parse_last_event_id(value):
+    """Разбирает Last-Event-ID вида "<epoch>:<id>". Возвращает (epoch, id) или (None, None)."""
+    if not value:
+        return None, None
+    epoch_part, sep, id_part = value.partition(':')
+    try:
+        if sep:
+            return int(epoch_part), int(id_part)
+        return None, int(epoch_part)
+    except ValueError:
+        return None, None
+
+
+class ChatBroadcaster:
+    """Рассылает новые сообщения ChatStore всем SSE-подписчикам.
+
+    Подписчики не опрашивают буфер по таймеру: они спят на общем Condition,
+    пока publish() не сообщит о записи (или не пора отправить heartbeat).
+    Каждое сообщение кодируется в SSE-кадр один раз и переиспользуется всеми.
+    Для общего хранилища (store.shared) фоновый поток этого broadcaster (одного
+    канала) следит за версией хранилища и будит подписчиков при записях из других
+    воркеров. Поток работает, только пока есть подписчики, и завершается после close().
+    """
+
+    def __init__(self, store, heartbeat_interval=15.0, retry_ms=3000, watch_interval=0.5):
+        self._store = store
+        self.heartbeat_interval = heartbeat_interval
+        self._retry_ms = retry_ms
+        self._watch_interval = watch_interval
+        self._watcher = None
+        self._closed = threading.Event()
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._subscribers = 0
+        self._frames_lock = threading.Lock()
+        self._frames = OrderedDict()  # id сообщения -> готовый SSE-кадр
+
+    @property
+    def subscriber_count(self):
+        return self._subscribers
+
+    def publish(self):
+        """Будит всех подписчиков после записи в хранилище."""
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def close(self):
+        """Останавливает поток наблюдения (канал вытеснен из реестра)."""
+        self._closed.set()
+
+    def _ensure_watcher(self):
+        with self._cond:
+            if self._watcher is not None or self._closed.is_set():
+                return
+            self._watcher = threading.Thread(target=self._watch_store, name='chat-store-watcher', daemon=True)
+            self._watcher.start()
+
+    def _watch_store(self):
+        last_version = self._store.version()
+        while not self._closed.wait(self._watch_interval):
+            with self._cond:
+                # Без подписчиков следить не за чем; следующий подписчик запустит поток заново.
+                if self._subscribers == 0:
+                    self._watcher = None
+                    return
+            version = self._store.version()
+            if version != last_version:
+                last_version = version
+                self.publish()
+        with self._cond:
+            self._watcher = None
+
+    def _wait(self, generation, timeout):
+        with self._cond:
+            if self._generation == generation:
+                self._cond.wait(timeout)
+            return self._generation
+
+    def _frame(self, epoch, message):
+        message_id = message["id"]
+        frame = self._frames.get(message_id)
+        if frame is None:
+            data = json.dumps(message, ensure_ascii=False, separators=(',', ':'))
+            frame = f"id: {epoch}:{message_id}\ndata: {data}\n\n".encode('utf-8')
+            with self._frames_lock:
+                self._frames[message_id] = frame
+                # Держим кадры только для сообщений, которые еще могут быть в буфере.
+                while len(self._frames) > self._store.maxlen:
+                    self._frames.popitem(last=False)
+        return frame
+
+    def _encode_delta(self, delta):
+        chunks = []
+        if delta.reset:
+            reset_data = json.dumps({"epoch": delta.epoch, "head": delta.head})
+            chunks.append(f"id: {delta.epoch}:{delta.head}\nevent: reset\ndata: {reset_data}\n\n".encode('utf-8'))
+        for message in delta.messages:
+            chunks.append(self._frame(delta.epoch, message))
+        return b"".join(chunks)
+
+    def stream(self, epoch=None, cursor=None):
+        """Генератор байтов SSE для одного подключения.
+
+        Без курсора (новое подключение) клиент получает событие reset и весь буфер;
+        с курсором из Last-Event-ID - только пропущенные сообщения.
+        """
+        with self._cond:
+            self._subscribers += 1
+        if self._store.shared:
+            self._ensure_watcher()
+        try:
+            yield f"retry: {self._retry_ms}\n\n".encode('utf-8')
+            if cursor is None:
+                cursor = -1  # Курсор "до начала эпохи" всегда дает reset
+            while True:
+                # Поколение запоминается до чтения буфера, чтобы не пропустить запись между ними.
+                generation = self._generation
+                delta = self._store.since(cursor, epoch)
+                payload = self._encode_delta(delta)
+                if payload:
+                    yield payload
+                epoch, cursor = delta.epoch, delta.head
+                if self._wait(generation, self.heartbeat_interval) == generation:
+                    yield b": ping\n\n"
+        finally:
+            with self._cond:
+                self._subscribers -= 1
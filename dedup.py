@@ -0,0 +1,60 @@
+# Файл: dedup.py
+# Ограниченное по размеру и времени множество недавно виденных ключей для идемпотентного приема логов.
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def dedup_key(*fields):
+    """Стабильный ключ дедупликации по полям: blake2b, одинаковый во всех процессах.
+
+    Встроенный hash() для строк солится при каждом запуске, поэтому не годится
+    для ключей, которые сверяют несколько воркеров через общую базу.
+    """
+    return hashlib.blake2b('\x1f'.join(map(str, fields)).encode('utf-8'), digest_size=16).digest()
+
+
+class RecentKeySet:
+    """Множество ключей, виденных за последние window секунд.
+
+    Проверка и добавление - O(1) (амортизированно). Записи старше окна удаляются
+    с головы очереди при каждом добавлении, а при превышении maxsize вытесняются
+    самые старые, поэтому память ограничена независимо от потока данных.
+    """
+
+    def __init__(self, maxsize=20000, window=600.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()  # ключ -> время добавления, в порядке добавления
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        with self._lock:
+            added_at = self._keys.get(key)
+            return added_at is not None and self._clock() - added_at < self.window
+
+    def add(self, key):
+        """Добавляет ключ. Возвращает False, если ключ уже был в окне (повтор)."""
+        now = self._clock()
+        with self._lock:
+            self._expire(now)
+            if key in self._keys:
+                return False
+            self._keys[key] = now
+            if len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+            return True
+
+    def _expire(self, now):
+        keys = self._keys
+        oldest_allowed = now - self.window
+        while keys:
+            key, added_at = next(iter(keys.items()))
+            if added_at > oldest_allowed:
+                break
+            del keys[key]
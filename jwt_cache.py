@@ -0,0 +1,69 @@
+# Файл: jwt_cache.py
+# LRU-кэш уже проверенных JWT: повторные запросы с тем же токеном не проверяют подпись.
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+
+class VerifiedTokenCache:
+    """Ограниченный LRU-кэш payload'ов проверенных токенов.
+
+    Ключ - строка токена целиком, поэтому любой измененный токен дает промах
+    и проходит полную проверку. Запись живет до exp токена: просроченная запись
+    удаляется и отклоняется через jwt.ExpiredSignatureError, как это сделал бы jwt.decode.
+    Токены без exp не кэшируются.
+    """
+
+    def __init__(self, maxsize=10000, sweep_interval=60.0, clock=time.time):
+        self.maxsize = maxsize
+        self._sweep_interval = sweep_interval
+        self._clock = clock
+        self._next_sweep = clock() + sweep_interval
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # токен -> (exp, payload)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token):
+        """Возвращает payload из кэша или None при промахе."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            exp, payload = entry
+            if exp <= self._clock():
+                del self._entries[token]
+                self.hits += 1
+                raise jwt.ExpiredSignatureError("Signature has expired")
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return payload
+
+    def put(self, token, payload):
+        exp = payload.get('exp')
+        if self.maxsize <= 0 or not isinstance(exp, (int, float)):
+            return
+        with self._lock:
+            self._entries[token] = (exp, payload)
+            self._entries.move_to_end(token)
+            now = self._clock()
+            if now >= self._next_sweep:
+                self._sweep_expired(now)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _sweep_expired(self, now):
+        # Полный проход не чаще раза в sweep_interval: просроченные токены не ждут вытеснения по LRU.
+        self._next_sweep = now + self._sweep_interval
+        for token in [t for t, (exp, _payload) in self._entries.items() if exp <= now]:
+            del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
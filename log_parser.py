@@ -0,0 +1,205 @@
+# Файл: log_parser.py
+# Разбор текстовых логов CS2: сообщения чата (say / say_team) и игровые события.
+import re
+from collections import namedtuple
+
+# Компактная запись сообщения чата, извлеченная из строки лога.
+ChatRecord = namedtuple('ChatRecord', ['ts', 'player_name', 'steamid', 'team', 'command', 'message'])
+# Игровые события для оверлея.
+KillEvent = namedtuple('KillEvent', ['ts', 'killer_name', 'killer_steamid', 'killer_team',
+                                     'victim_name', 'victim_steamid', 'victim_team', 'weapon', 'headshot'])
+RoundEvent = namedtuple('RoundEvent', ['ts', 'phase'])  # phase: 'start' или 'end'
+TeamSwitchEvent = namedtuple('TeamSwitchEvent', ['ts', 'player_name', 'steamid', 'from_team', 'to_team'])
+
+# --- Regex Definition for Chat ---
+CHAT_REGEX_SAY = re.compile(
+    r"""
+    \s*                                      # Опциональные пробелы в начале строки (match() привязан к началу).
+    (?:\d{2}\/\d{2}\/\d{4}\s+-\s+)?      # Опциональная дата (ДД/ММ/ГГГГ - ).
+    (?P<timestamp>\d{2}:\d{2}:\d{2}\.\d{3})  # Временная метка (ЧЧ:ММ:СС.мс)
+    \s+-\s+                                  # Разделитель " - ".
+    \"(?P<player_name>.+?)<(?P<userid>\d+)><(?P<steamid>\[U:\d:\d+\])><(?P<player_team>\w+)>\"
+    \s+                                      # Пробел.
+    (?P<chat_command>say|say_team)           # Команда чата ('say' или 'say_team')
+    \s+                                      # Пробел.
+    \"(?P<message>.*)\"                      # Содержимое сообщения в кавычках
+    \s*$                                     # Опциональные пробелы, конец строки.
+    """,
+    re.VERBOSE
+)
+
+# Дешевый маркер: строка без подстроки 'say' не может быть сообщением чата.
+# CS2 всегда пишет команду в нижнем регистре, поэтому и маркер, и регулярное
+# выражение регистрозависимые: строки с SAY/Say не принимаются.
+CHAT_LINE_MARKER = 'say'
+
+
+def parse_log_batch(lines):
+    """Разбирает пачку строк лога и возвращает список ChatRecord только для строк чата.
+
+    Строки без маркера чата отбрасываются до запуска регулярного выражения.
+    """
+    records = []
+    marker = CHAT_LINE_MARKER
+    match = CHAT_REGEX_SAY.match
+    append = records.append
+    for line in lines:
+        if marker not in line:
+            continue
+        chat_match = match(line)
+        if chat_match is None:
+            continue
+        ts, player_name, _userid, steamid, team, command, message = chat_match.groups()
+        append(ChatRecord(ts, player_name.strip(), steamid, team, command, message.strip()))
+    return records
+
+
+# --- Разбор с диспетчеризацией по глаголу ---
+# Общий префикс строки разбирается один раз: время, затем блок игрока
+# "Имя<userid><steamid><команда>" (команды нет у switched) или слово-субъект (World),
+# необязательные координаты [x y z] и глагол. Остаток строки после глагола
+# передается обработчику, зарегистрированному для этого глагола.
+LOG_LINE_PREFIX = re.compile(
+    r"""
+    \s*
+    (?:\d{2}\/\d{2}\/\d{4}\s+-\s+)?
+    (?P<timestamp>\d{2}:\d{2}:\d{2}\.\d{3})
+    \s+-\s+
+    (?:
+        \"(?P<player_name>.+?)<(?P<userid>\d+)><(?P<steamid>[^>]*)>(?:<(?P<player_team>[^>]*)>)?\"
+      | (?P<subject>\w+)
+    )
+    \s+
+    (?:\[[^\]]*\]\s+)?                      # Координаты игрока (killed, attacked)
+    (?P<verb>[a-z_]+)
+    \s*
+    """,
+    re.VERBOSE
+)
+
+_KILL_ARGS = re.compile(
+    r'\"(?P<name>.+?)<\d+><(?P<steamid>[^>]*)><(?P<team>[^>]*)>\"\s+(?:\[[^\]]*\]\s+)?'
+    r'with\s+\"(?P<weapon>[^"]*)\"(?P<flags>.*)$'
+)
+_SWITCH_ARGS = re.compile(r'from\s+team\s+<(?P<from_team>[^>]*)>\s+to\s+<(?P<to_team>[^>]*)>')
+_ROUND_PHASES = {'"Round_Start"': 'start', '"Round_End"': 'end'}
+
+
+class LogEventParser:
+    """Однопроходный разбор строк лога с обработчиками, зарегистрированными по глаголу.
+
+    На каждую строку выполняется одно сопоставление LOG_LINE_PREFIX и поиск
+    глагола в словаре, поэтому стоимость строки не зависит от числа типов событий.
+    Строки, в которых нет ни одного зарегистрированного глагола даже как подстроки
+    (attacked, purchased и т.п.), отбрасываются до регулярного выражения; эта проверка
+    стоит одного поиска подстроки на глагол, что много дешевле сопоставления префикса.
+    Обработчик вызывается как handler(prefix_match, args) и возвращает событие
+    или None, если строка ему не подходит.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._markers = ()
+
+    @property
+    def handlers(self):
+        """Копия словаря глагол -> обработчик."""
+        return dict(self._handlers)
+
+    def register(self, *verbs):
+        """Декоратор: @parser.register('say', 'say_team')."""
+        def decorator(handler):
+            for verb in verbs:
+                if verb in self._handlers:
+                    raise ValueError(f"Для глагола {verb!r} уже зарегистрирован обработчик")
+                self._handlers[verb] = handler
+            # Глагол, содержащий другой зарегистрированный глагол (say_team и say),
+            # отдельной проверки подстроки не требует.
+            self._markers = tuple(sorted(
+                verb for verb in self._handlers
+                if not any(other != verb and other in verb for other in self._handlers)
+            ))
+            return handler
+        return decorator
+
+    def iter_events(self, lines):
+        """Генератор событий по строкам (любой итерируемый объект): ничего не накапливает."""
+        match = LOG_LINE_PREFIX.match
+        get_handler = self._handlers.get
+        markers = self._markers
+        for line in lines:
+            for marker in markers:
+                if marker in line:
+                    break
+            else:
+                continue
+            prefix = match(line)
+            if prefix is None:
+                continue
+            handler = get_handler(prefix.group('verb'))
+            if handler is None:
+                continue
+            event = handler(prefix, line[prefix.end():])
+            if event is not None:
+                yield event
+
+    def parse(self, lines):
+        """Разбирает пачку строк (любой итерируемый объект) и возвращает список событий."""
+        return list(self.iter_events(lines))
+
+
+default_event_parser = LogEventParser()
+
+
+@default_event_parser.register('say', 'say_team')
+def _handle_chat(prefix, args):
+    # Строка проверяется тем же CHAT_REGEX_SAY, что и в parse_log_batch, чтобы оба пути
+    # приема принимали одни и те же строки чата. Строк чата мало, поэтому второе
+    # сопоставление не сказывается на стоимости разбора остальных строк.
+    chat_match = CHAT_REGEX_SAY.match(prefix.string)
+    if chat_match is None:
+        return None
+    ts, player_name, _userid, steamid, team, command, message = chat_match.groups()
+    return ChatRecord(ts, player_name.strip(), steamid, team, command, message.strip())
+
+
+@default_event_parser.register('killed')
+def _handle_kill(prefix, args):
+    if prefix.group('player_name') is None:
+        return None
+    victim = _KILL_ARGS.match(args)
+    if victim is None:
+        return None  # Например, "killed other" (курица, предметы)
+    return KillEvent(prefix.group('timestamp'), prefix.group('player_name').strip(), prefix.group('steamid'),
+                     prefix.group('player_team') or '', victim.group('name').strip(), victim.group('steamid'),
+                     victim.group('team'), victim.group('weapon'), 'headshot' in victim.group('flags'))
+
+
+@default_event_parser.register('triggered')
+def _handle_world_trigger(prefix, args):
+    if prefix.group('subject') != 'World':
+        return None
+    phase = _ROUND_PHASES.get(args.rstrip())
+    return RoundEvent(prefix.group('timestamp'), phase) if phase else None
+
+
+@default_event_parser.register('switched')
+def _handle_team_switch(prefix, args):
+    if prefix.group('player_name') is None:
+        return None
+    switch = _SWITCH_ARGS.match(args)
+    if switch is None:
+        return None
+    return TeamSwitchEvent(prefix.group('timestamp'), prefix.group('player_name').strip(), prefix.group('steamid'),
+                           switch.group('from_team'), switch.group('to_team'))
+
+
+def iter_log_events(lines):
+    """Как parse_log_events, но возвращает генератор - для потокового разбора тела запроса."""
+    return default_event_parser.iter_events(lines)
+
+
+def parse_log_events(lines):
+    """Разбирает пачку строк лога и возвращает все распознанные события
+    (ChatRecord, KillEvent, RoundEvent, TeamSwitchEvent) в порядке строк."""
+    return default_event_parser.parse(lines)
@@ -0,0 +1,119 @@
+# Файл: log_stream.py
+# Потоковое чтение тела запроса с логами: построчно, с поддержкой gzip и лимитами.
+import zlib
+
+SUPPORTED_CONTENT_ENCODINGS = ('', 'identity', 'gzip', 'x-gzip')
+
+
+class PayloadTooLarge(Exception):
+    """Тело запроса (после распаковки) превысило допустимый размер."""
+
+
+class UnsupportedContentEncoding(Exception):
+    """Content-Encoding, который сервер не умеет распаковывать."""
+
+
+class CorruptedBody(Exception):
+    """Сжатое тело запроса обрезано или повреждено."""
+
+
+class LogLineReader:
+    """Итератор по строкам лога из файлоподобного потока байтов.
+
+    Поток читается блоками по chunk_size, gzip распаковывается на лету блоками
+    того же размера, поэтому память не зависит от размера тела. Строки длиннее
+    max_line_length пропускаются (счетчик skipped_lines). Если распакованное тело
+    больше max_body_bytes, итерация прерывается исключением PayloadTooLarge, а если
+    gzip-тело обрывается до конца потока или содержит мусор, - исключением CorruptedBody.
+    Несколько склеенных gzip-потоков подряд допустимы (как у gzip -c a b).
+    """
+
+    def __init__(self, stream, content_encoding='', max_body_bytes=64 * 1024 * 1024,
+                 max_line_length=8192, chunk_size=64 * 1024):
+        content_encoding = (content_encoding or '').strip().lower()
+        if content_encoding not in SUPPORTED_CONTENT_ENCODINGS:
+            raise UnsupportedContentEncoding(content_encoding)
+        self._stream = stream
+        self._gzip = content_encoding in ('gzip', 'x-gzip')
+        self.max_body_bytes = max_body_bytes
+        self.max_line_length = max_line_length
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self.lines = 0
+        self.skipped_lines = 0
+
+    def _raw_chunks(self):
+        read = self._stream.read
+        chunk_size = self.chunk_size
+        while True:
+            chunk = read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def _decoded_chunks(self):
+        if not self._gzip:
+            yield from self._raw_chunks()
+            return
+        # 16 + MAX_WBITS - формат gzip; max_length не дает "gzip-бомбе" распаковаться в память целиком.
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        received = False
+        try:
+            for chunk in self._raw_chunks():
+                received = True
+                while chunk:
+                    data = decompressor.decompress(chunk, self.chunk_size)
+                    if data:
+                        yield data
+                    if decompressor.eof:
+                        # Остаток - следующий gzip-поток того же тела; мусор вместо него даст zlib.error.
+                        chunk = decompressor.unused_data
+                        if chunk:
+                            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    else:
+                        chunk = decompressor.unconsumed_tail
+            tail = decompressor.flush()
+        except zlib.error as e:
+            raise CorruptedBody(str(e)) from e
+        if tail:
+            yield tail
+        # Без проверки eof обрезанное при передаче тело молча принималось бы частично.
+        if received and not decompressor.eof:
+            raise CorruptedBody('gzip-поток оборван')
+
+    def __iter__(self):
+        pending = b''
+        skipping = False  # Дочитываем до конца слишком длинную строку
+        max_line_length = self.max_line_length
+        for data in self._decoded_chunks():
+            self.bytes_read += len(data)
+            if self.bytes_read > self.max_body_bytes:
+                raise PayloadTooLarge(self.bytes_read)
+            last_newline = data.rfind(b'\n')
+            if last_newline < 0:
+                pending += data
+                if len(pending) > max_line_length:
+                    pending = b''
+                    if not skipping:
+                        skipping = True
+                        self.skipped_lines += 1
+                continue
+            # До последнего \n строки полные, поэтому UTF-8 можно декодировать одним куском.
+            complete = (pending + data[:last_newline]).decode('utf-8', 'replace').split('\n')
+            pending = data[last_newline + 1:]
+            if skipping:
+                complete = complete[1:]  # Хвост слишком длинной строки
+                skipping = False
+            for line in complete:
+                if len(line) > max_line_length:
+                    self.skipped_lines += 1
+                    continue
+                self.lines += 1
+                yield line.rstrip('\r')
+        if pending and not skipping:
+            line = pending.decode('utf-8', 'replace')
+            if len(line) > max_line_length:
+                self.skipped_lines += 1
+            else:
+                self.lines += 1
+                yield line.rstrip('\r')
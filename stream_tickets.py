@@ -0,0 +1,52 @@
+# Файл: stream_tickets.py
+# Одноразовые короткоживущие билеты для /chat/stream. EventSource в браузере не умеет
+# отправлять заголовок Authorization, а JWT расширения в URL попадает в логи роутера платформы.
+import hashlib
+import hmac
+import secrets
+import time
+
+import jwt
+
+from dedup import RecentKeySet
+
+TICKET_AUDIENCE = 'cs2chat:chat-stream'
+
+
+class StreamTicketIssuer:
+    """Выдает и погашает билеты на подключение к /chat/stream.
+
+    Билет - JWT (HS256) на ключе, производном от секрета расширения, с audience
+    TICKET_AUDIENCE, сроком ttl секунд и случайным jti. Билет не подходит как токен
+    расширения (у него другой ключ), а погашенные jti запоминаются на время жизни
+    билета, поэтому повторное использование отклоняется. Погашенные jti хранятся
+    в памяти процесса: при нескольких воркерах билет одноразовый в пределах воркера,
+    но в любом случае живет не дольше ttl.
+    """
+
+    def __init__(self, secret, ttl=30, max_redeemed=100000):
+        self._key = hmac.new(secret, b'cs2chat stream ticket', hashlib.sha256).digest()
+        self.ttl = int(ttl)
+        self._redeemed = RecentKeySet(maxsize=max_redeemed, window=self.ttl + 5)
+
+    def issue(self, claims):
+        """Возвращает билет с claims (channel_id и т.п. из JWT зрителя)."""
+        now = int(time.time())
+        payload = {
+            "aud": TICKET_AUDIENCE,
+            "iat": now,
+            "exp": now + self.ttl,
+            "jti": secrets.token_urlsafe(16),
+            "claims": claims,
+        }
+        return jwt.encode(payload, self._key, algorithm='HS256')
+
+    def redeem(self, ticket):
+        """Погашает билет. Возвращает claims или None (неверный, просроченный или уже использованный)."""
+        try:
+            payload = jwt.decode(ticket, self._key, algorithms=['HS256'], audience=TICKET_AUDIENCE)
+        except jwt.InvalidTokenError:
+            return None
+        if not self._redeemed.add(payload.get('jti')):
+            return None
+        return payload.get('claims') or {}
@@ -0,0 +1,186 @@
+# Файл: udp_receiver.py
+# Прием логов CS2 по UDP (logaddress_add) без промежуточного HTTP-ретранслятора.
+import hmac
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Заголовок пакета лога Source: 4 байта 0xFF и тип пакета.
+# 'R' - без пароля; 'S' - с sv_logsecret: сразу за типом идет секрет, затем "L <строка>".
+PACKET_PREFIX = b'\xff\xff\xff\xff'
+PACKET_TYPE_PLAIN = b'R'
+PACKET_TYPE_SECRET = b'S'
+
+
+def parse_udp_sources(value, default_channel_id):
+    """Разбирает UDP_LOG_SOURCES вида "ip[:port][=channel_id],..." в словарь (ip, port|None) -> channel_id."""
+    sources = {}
+    for item in (value or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        address, _sep, channel_id = item.partition('=')
+        host, sep, port = address.strip().rpartition(':')
+        if not sep:
+            host, port = port, ''
+        try:
+            resolved_host = socket.gethostbyname(host)
+            resolved_port = int(port) if port else None
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Некорректный источник в UDP_LOG_SOURCES: {item!r}") from e
+        sources[(resolved_host, resolved_port)] = channel_id.strip() or default_channel_id
+    return sources
+
+
+def decode_log_packet(data, log_secret=None):
+    """Возвращает строки лога из одного UDP-пакета (без заголовка, префикса 'L ' и завершающего NUL).
+
+    log_secret (bytes) - значение sv_logsecret на серверах. Если он задан, принимаются только
+    пакеты 'S' с этим секретом; без него пакеты 'S' отклоняются. Для отклоненного пакета
+    возвращается None.
+    """
+    if data.startswith(PACKET_PREFIX):
+        packet_type = data[4:5]
+        data = data[5:]  # 4 байта 0xFF + байт типа пакета
+        if packet_type == PACKET_TYPE_SECRET:
+            if log_secret is None:
+                return None
+            packet_secret = data[:len(log_secret)]
+            data = data[len(log_secret):]
+            if not hmac.compare_digest(packet_secret, log_secret) or not data.startswith(b'L '):
+                return None
+        elif packet_type != PACKET_TYPE_PLAIN or log_secret is not None:
+            return None
+    elif log_secret is not None:
+        return None
+    text = data.rstrip(b'\x00').decode('utf-8', 'replace')
+    lines = []
+    for line in text.splitlines():
+        if line.startswith('L '):
+            line = line[2:]
+        if line:
+            lines.append(line)
+    return lines
+
+
+class UdpLogReceiver:
+    """Слушает UDP-порт и передает строки лога пачками в on_batch(channel_id, lines).
+
+    Пакеты принимаются только от адресов из sources; остальные отбрасываются.
+    Если задан log_secret (sv_logsecret), пакеты без этого секрета отклоняются.
+    Пачка канала отправляется, когда набралось batch_size строк или с момента
+    первой строки в ней прошло batch_interval секунд.
+    """
+
+    def __init__(self, host, port, sources, on_batch, batch_size=500, batch_interval=0.2, log_secret=None):
+        self.host = host
+        self.port = port
+        self._sources = dict(sources)
+        self._on_batch = on_batch
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self._log_secret = log_secret.encode('utf-8') if isinstance(log_secret, str) else log_secret
+        self._pending = {}  # channel_id -> список строк
+        self._pending_lines = 0
+        self._pending_since = None
+        self._sock = None
+        self._thread = None
+        self._running = False
+        self.packets = 0
+        self.lines = 0
+        self.dropped_packets = 0
+        self.rejected_packets = 0
+
+    def _channel_for(self, address):
+        host, port = address[0], address[1]
+        channel_id = self._sources.get((host, port))
+        if channel_id is None:
+            channel_id = self._sources.get((host, None))
+        return channel_id
+
+    def bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Несколько воркеров gunicorn могут слушать один порт; ядро закрепляет источник за одним из них.
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind((self.host, self.port))
+        self.port = sock.getsockname()[1]
+        self._sock = sock
+        return self.port
+
+    def start(self):
+        if self._sock is None:
+            self.bind()
+        self._running = True
+        self._thread = threading.Thread(target=self.serve_forever, name='udp-log-receiver', daemon=True)
+        self._thread.start()
+        logger.info(f"UDP-прием логов запущен на {self.host}:{self.port}, источников: {len(self._sources)}.")
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        self._pending_lines = 0
+        self._pending_since = None
+        for channel_id, lines in pending.items():
+            try:
+                self._on_batch(channel_id, lines)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке UDP-пачки канала {channel_id}: {e}", exc_info=True)
+
+    def serve_forever(self):
+        sock = self._sock
+        recvfrom = sock.recvfrom
+        while self._running:
+            if self._pending_since is None:
+                timeout = 0.5  # Периодически просыпаемся, чтобы заметить stop()
+            else:
+                timeout = max(0.0, self._pending_since + self.batch_interval - time.monotonic())
+            sock.settimeout(timeout)
+            try:
+                data, address = recvfrom(65535)
+            except socket.timeout:
+                if self._pending_since is not None:
+                    self._flush()
+                continue
+            except OSError:
+                if not self._running:
+                    break
+                raise
+
+            channel_id = self._channel_for(address)
+            if channel_id is None:
+                self.dropped_packets += 1
+                logger.debug("UDP-пакет от неразрешенного источника %s:%s отброшен.", address[0], address[1])
+                continue
+            lines = decode_log_packet(data, self._log_secret)
+            if lines is None:
+                self.rejected_packets += 1
+                if self.rejected_packets == 1:
+                    logger.warning("Отклонен UDP-пакет от %s:%s: проверьте sv_logsecret на сервере и UDP_LOG_SECRET.", address[0], address[1])
+                logger.debug("UDP-пакет от %s:%s отклонен: неверный тип пакета или sv_logsecret.", address[0], address[1])
+                continue
+            self.packets += 1
+            if not lines:
+                continue
+            self.lines += len(lines)
+            self._pending.setdefault(channel_id, []).extend(lines)
+            self._pending_lines += len(lines)
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            if self._pending_lines >= self.batch_size \
+                    or time.monotonic() - self._pending_since >= self.batch_interval:
+                self._flush()
+        if self._pending:
+            self._flush()